@@ -0,0 +1,36 @@
+"""Remember workbook and row fingerprints of the last Excel sync
+
+Revision ID: 20261017_excel_sync_state
+Revises: 20261017_import_ingest_backend
+Create Date: 2026-10-17 20:00:00
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_excel_sync_state"
+down_revision = "20261017_import_ingest_backend"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("vehicle_stock", sa.Column("excel_row_digest", sa.String(length=32), nullable=True))
+    op.create_table(
+        "excel_sync_states",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("workbook_path", sa.String(length=500), nullable=False),
+        sa.Column("file_mtime_ns", sa.BigInteger(), nullable=False),
+        sa.Column("file_size", sa.BigInteger(), nullable=False),
+        sa.Column("file_sha256", sa.String(length=64), nullable=False),
+        sa.Column("row_count", sa.Integer(), nullable=False),
+        sa.Column("synced_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint("workbook_path", name="uq_excel_sync_states_workbook_path"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("excel_sync_states")
+    op.drop_column("vehicle_stock", "excel_row_digest")
@@ -0,0 +1,46 @@
+"""Track import file hashes, chunk checkpoints and row digests
+
+Revision ID: 20261017_import_checkpoints
+Revises: 20251026_excel_sync
+Create Date: 2026-10-17 09:00:00
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_import_checkpoints"
+down_revision = "20251026_excel_sync"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("import_jobs", sa.Column("file_sha256", sa.String(length=64), nullable=True))
+    op.add_column("import_jobs", sa.Column("checkpoint_row", sa.Integer(), server_default="0", nullable=False))
+    op.create_index("ix_import_jobs_file_sha256", "import_jobs", ["file_sha256"], unique=False)
+
+    op.create_table(
+        "import_row_digests",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("branch_code", sa.String(length=20), nullable=False),
+        sa.Column("model_code", sa.String(length=50), nullable=False),
+        sa.Column("digest", sa.String(length=32), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index(
+        "ix_import_row_digests_branch_model",
+        "import_row_digests",
+        ["branch_code", "model_code"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_row_digests_branch_model", table_name="import_row_digests")
+    op.drop_table("import_row_digests")
+
+    op.drop_index("ix_import_jobs_file_sha256", table_name="import_jobs")
+    op.drop_column("import_jobs", "checkpoint_row")
+    op.drop_column("import_jobs", "file_sha256")
@@ -0,0 +1,24 @@
+"""Mark import row digests cleared by inventory changes made outside imports
+
+Revision ID: 20261017_import_digest_cleared
+Revises: 20261017_excel_sync_state
+Create Date: 2026-10-17 21:00:00
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_import_digest_cleared"
+down_revision = "20261017_excel_sync_state"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("import_row_digests", sa.Column("cleared_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("import_row_digests", "cleared_at")
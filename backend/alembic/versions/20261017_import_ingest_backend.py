@@ -0,0 +1,27 @@
+"""Select the ingestion backend per import job
+
+Revision ID: 20261017_import_ingest_backend
+Revises: 20261017_import_sheet_names
+Create Date: 2026-10-17 18:00:00
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_import_ingest_backend"
+down_revision = "20261017_import_sheet_names"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "import_jobs",
+        sa.Column("ingest_backend", sa.String(length=20), server_default="orm", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("import_jobs", "ingest_backend")
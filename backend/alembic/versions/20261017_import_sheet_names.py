@@ -0,0 +1,24 @@
+"""Record the worksheets selected for multi-sheet imports
+
+Revision ID: 20261017_import_sheet_names
+Revises: 20261017_import_checkpoints
+Create Date: 2026-10-17 14:00:00
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_import_sheet_names"
+down_revision = "20261017_import_checkpoints"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("import_jobs", sa.Column("sheet_names", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("import_jobs", "sheet_names")
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from io import BytesIO
+import asyncio
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi.responses import FileResponse
 
 from app.api import deps
-from app.schemas.import_job import ImportJobCreate, ImportJobRead
-from app.services.imports import ImportService
+from app.models.import_log import ImportJob
+from app.schemas.import_job import ImportJobCreate, ImportJobRead, ImportMetricsBucket, ImportPreview, IngestBackend
+from app.services.imports import ImportService, UploadTooLargeError
+from app.tasks.imports import process_import_job
 
 router = APIRouter()
 
@@ -18,20 +21,100 @@ async def list_import_jobs(session=Depends(deps.get_session)):
     return jobs
 
 
-@router.post("/upload", response_model=ImportJobRead)
+@router.get("/jobs/metrics", response_model=list[ImportMetricsBucket])
+async def import_job_metrics(
+    limit: int = Query(200, ge=1, le=1000),
+    session=Depends(deps.get_session),
+):
+    service = ImportService(session)
+    return await service.performance_summary(limit=limit)
+
+
+@router.get("/jobs/{job_id}", response_model=ImportJobRead)
+async def get_import_job(job_id: int, session=Depends(deps.get_session)):
+    service = ImportService(session)
+    job = await service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/errors", response_class=FileResponse)
+async def download_import_errors(job_id: int, session=Depends(deps.get_session)):
+    """Stream the job's full row-level error report as CSV."""
+    service = ImportService(session)
+    job = await service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    report_path = service.error_report_path(job)
+    if report_path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job has no error report")
+    return FileResponse(report_path, media_type="text/csv", filename=f"import-{job_id}-errors.csv")
+
+
+@router.post("/preview", response_model=ImportPreview)
+async def preview_import(
+    file: UploadFile = File(...),
+    sheet_name: str | None = Form(default=None),
+    rows: int = Form(default=20, ge=1, le=200),
+):
+    """Show the header, first rows and detected mapping of a file without importing it."""
+    try:
+        return await ImportService.preview(file.filename, file.file, sheet_name=sheet_name, limit=rows)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
+@router.post("/upload", response_model=ImportJobRead, status_code=status.HTTP_202_ACCEPTED)
 async def upload_import(
     file: UploadFile = File(...),
     branch_id: int | None = Form(default=None),
     sheet_name: str | None = Form(default=None),
+    sheet_names: list[str] | None = Form(default=None),
+    all_sheets: bool = Form(default=False),
+    ingest_backend: IngestBackend = Form(default="orm"),
     session=Depends(deps.get_session),
 ):
-    contents = await file.read()
-    if not contents:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Uploaded file is empty")
     service = ImportService(session)
-    payload = ImportJobCreate(source_filename=file.filename, branch_id=branch_id, sheet_name=sheet_name)
+    payload = ImportJobCreate(
+        source_filename=file.filename,
+        branch_id=branch_id,
+        sheet_name=sheet_name,
+        sheet_names=sheet_names,
+        all_sheets=all_sheets,
+        ingest_backend=ingest_backend,
+    )
     try:
-        job = await service.queue_import(payload=payload, file_buffer=BytesIO(contents), uploaded_by_id=None)
+        job = await service.queue_import(payload=payload, source=file, uploaded_by_id=None)
+    except UploadTooLargeError as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    if job.status == "pending":
+        await _enqueue_job(service, job)
     return job
+
+
+@router.post("/jobs/{job_id}/retry", response_model=ImportJobRead, status_code=status.HTTP_202_ACCEPTED)
+async def retry_import_job(job_id: int, session=Depends(deps.get_session)):
+    service = ImportService(session)
+    job = await service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    if job.status != "failed":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only failed import jobs can be retried")
+    await _enqueue_job(service, job)
+    return job
+
+
+async def _enqueue_job(service: ImportService, job: ImportJob) -> None:
+    try:
+        # Publishing blocks on the broker (or runs the task inline in eager mode), so keep it off the loop.
+        await asyncio.to_thread(process_import_job.delay, job.id)
+    except Exception as exc:
+        # Otherwise the job would stay pending forever with nothing left to run it.
+        await service.mark_enqueue_failed(job, exc)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Import job {job.id} could not be queued; retry it once the worker queue is available",
+        ) from exc
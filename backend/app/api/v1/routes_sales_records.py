@@ -2,10 +2,11 @@ from __future__ import annotations
 
 from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import and_, select
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, and_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_db, get_current_active_user
@@ -17,6 +18,7 @@ from app.schemas.sales_record import (
     SalesRecordUpdate,
 )
 from app.services.excel_sync import ExcelSyncService
+from app.services.table_export import MEDIA_TYPES, ExportFormat, export_filename, stream_query
 
 
 router = APIRouter()
@@ -44,21 +46,9 @@ async def list_sales(
 ):
     await _purge_overdue_unpaid_sales(db)
 
-    query = select(SalesRecord)
-
-    if current_user.user_role == UserRole.SALESMAN:
-        query = query.where(SalesRecord.executive_id == current_user.id)
-    elif executive_id:
-        query = query.where(SalesRecord.executive_id == executive_id)
-
-    if location:
-        query = query.where(SalesRecord.location == location)
-    if payment_mode:
-        query = query.where(SalesRecord.payment_mode == payment_mode)
-    if from_date:
-        query = query.where(SalesRecord.payment_date >= from_date)
-    if to_date:
-        query = query.where(SalesRecord.payment_date <= to_date)
+    query = _filter_sales(
+        select(SalesRecord), current_user, location, payment_mode, from_date, to_date, executive_id
+    )
 
     query = query.offset(skip).limit(limit).order_by(SalesRecord.created_at.desc())
 
@@ -71,6 +61,39 @@ async def list_sales(
     return [SalesRecordSchema.model_validate(sale) for sale in sales]
 
 
+@router.get("/export/rows")
+async def export_sales_rows(
+    format: ExportFormat = "csv",
+    gzip: bool = False,
+    location: Optional[str] = None,
+    payment_mode: Optional[str] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    executive_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Stream sales records as CSV or NDJSON, with the same filters and visibility as the list endpoint."""
+    await _purge_overdue_unpaid_sales(db)
+
+    query = _filter_sales(
+        select(*SalesRecord.__table__.columns),
+        current_user,
+        location,
+        payment_mode,
+        from_date,
+        to_date,
+        executive_id,
+    ).order_by(SalesRecord.id)
+
+    filename = export_filename("sales_records", format, gzip)
+    return StreamingResponse(
+        stream_query(query, format, gzip, label="sales_records"),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.post("/", response_model=SalesRecordSchema, status_code=status.HTTP_201_CREATED)
 async def create_sale(
     sale_in: SalesRecordCreate,
@@ -131,10 +154,10 @@ async def create_sale(
     )
 
     db.add(sale)
+    await _sync_stock(vehicle_stock, db)
     await db.commit()
     await db.refresh(sale, ["customer", "executive"])
     await db.refresh(vehicle_stock)
-    await _sync_stock(vehicle_stock, db)
 
     return SalesRecordSchema.model_validate(sale)
 
@@ -181,14 +204,15 @@ async def update_sale(
     for field, value in update_data.items():
         setattr(sale, field, value)
 
-    await db.commit()
-    await db.refresh(sale, ["customer", "executive"])
-
     if sale.vehicle_stock_id:
         stock = await db.get(VehicleStock, sale.vehicle_stock_id)
         if stock:
             await _sync_stock(stock, db)
 
+    await db.commit()
+    # The server-side updated_at was expired by the flush.
+    await db.refresh(sale, ["updated_at", "customer", "executive"])
+
     return SalesRecordSchema.model_validate(sale)
 
 
@@ -214,10 +238,9 @@ async def delete_sale(
             vehicle_stock.reserved -= 1
 
     await db.delete(sale)
-    await db.commit()
-
     if vehicle_stock:
         await _sync_stock(vehicle_stock, db)
+    await db.commit()
 
 
 async def _update_payment_state(sale: SalesRecord, is_received: bool, db: AsyncSession) -> None:
@@ -235,9 +258,30 @@ async def _update_payment_state(sale: SalesRecord, is_received: bool, db: AsyncS
         if stock:
             stock.reserved += 1
 
-    if stock:
-        await db.flush()
-        await _sync_stock(stock, db)
+
+def _filter_sales(
+    query: Select,
+    current_user: User,
+    location: Optional[str],
+    payment_mode: Optional[str],
+    from_date: Optional[date],
+    to_date: Optional[date],
+    executive_id: Optional[int],
+) -> Select:
+    if current_user.user_role == UserRole.SALESMAN:
+        query = query.where(SalesRecord.executive_id == current_user.id)
+    elif executive_id:
+        query = query.where(SalesRecord.executive_id == executive_id)
+
+    if location:
+        query = query.where(SalesRecord.location == location)
+    if payment_mode:
+        query = query.where(SalesRecord.payment_mode == payment_mode)
+    if from_date:
+        query = query.where(SalesRecord.payment_date >= from_date)
+    if to_date:
+        query = query.where(SalesRecord.payment_date <= to_date)
+    return query
 
 
 async def _purge_overdue_unpaid_sales(db: AsyncSession) -> int:
@@ -253,28 +297,26 @@ async def _purge_overdue_unpaid_sales(db: AsyncSession) -> int:
     if not overdue:
         return 0
 
-    affected: Set[int] = set()
+    affected: dict[int, VehicleStock] = {}
     for sale in overdue:
         stock = await db.get(VehicleStock, sale.vehicle_stock_id) if sale.vehicle_stock_id else None
         if stock:
             stock.quantity += 1
             if stock.reserved > 0:
                 stock.reserved -= 1
-            affected.add(stock.id)
+            affected[stock.id] = stock
         await db.delete(sale)
 
-    await db.commit()
-
     service = ExcelSyncService(db, Path(settings.EXCEL_INVENTORY_PATH))
-    for stock_id in affected:
-        stock = await db.get(VehicleStock, stock_id)
-        if stock:
-            await _sync_stock(stock, db, service)
+    for stock in affected.values():
+        await _sync_stock(stock, db, service)
 
+    await db.commit()
     return len(overdue)
 
 
 async def _sync_stock(stock: VehicleStock, db: AsyncSession, service: ExcelSyncService | None = None) -> None:
+    """Queue the stock's write-back with the caller's transaction; it reaches the workbook once that commits."""
     if service is None:
         service = ExcelSyncService(db, Path(settings.EXCEL_INVENTORY_PATH))
     stock.last_synced_at = datetime.utcnow()
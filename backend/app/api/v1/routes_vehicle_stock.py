@@ -1,7 +1,8 @@
+from email.utils import format_datetime
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import and_, select
 from typing import List, Optional
@@ -10,6 +11,7 @@ from app.api.deps import get_db, get_current_active_user
 from app.core.config import settings
 from app.models import User, UserRole, VehicleStock
 from app.services.excel_sync import ExcelSyncService
+from app.services.table_export import MEDIA_TYPES, ExportFormat, export_filename, stream_query
 from app.schemas.vehicle_stock import (
     VehicleStock as VehicleStockSchema,
     VehicleStockCreate,
@@ -41,16 +43,7 @@ async def list_vehicle_stock(
     """List all vehicle stock with optional filtering"""
     query = select(VehicleStock)
     
-    filters = []
-    if model_name:
-        filters.append(VehicleStock.model_name == model_name)
-    if branch_code:
-        filters.append(VehicleStock.branch_code == branch_code)
-    if city:
-        filters.append(VehicleStock.city == city)
-    if in_stock_only:
-        filters.append(VehicleStock.quantity > 0)
-    
+    filters = _stock_filters(model_name, branch_code, city, in_stock_only)
     if filters:
         query = query.where(and_(*filters))
     
@@ -65,6 +58,49 @@ async def list_vehicle_stock(
     return result.scalars().all()
 
 
+@router.get("/export/rows")
+async def export_vehicle_stock_rows(
+    format: ExportFormat = "csv",
+    gzip: bool = False,
+    model_name: Optional[str] = None,
+    branch_code: Optional[str] = None,
+    city: Optional[str] = None,
+    in_stock_only: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Stream vehicle stock as CSV or NDJSON, with the same filters as the list endpoint"""
+    query = select(*VehicleStock.__table__.columns)
+    filters = _stock_filters(model_name, branch_code, city, in_stock_only)
+    if filters:
+        query = query.where(and_(*filters))
+    query = query.order_by(VehicleStock.id)
+
+    filename = export_filename("vehicle_stock", format, gzip)
+    return StreamingResponse(
+        stream_query(query, format, gzip, label="vehicle_stock"),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _stock_filters(
+    model_name: Optional[str],
+    branch_code: Optional[str],
+    city: Optional[str],
+    in_stock_only: bool,
+) -> list:
+    filters = []
+    if model_name:
+        filters.append(VehicleStock.model_name == model_name)
+    if branch_code:
+        filters.append(VehicleStock.branch_code == branch_code)
+    if city:
+        filters.append(VehicleStock.city == city)
+    if in_stock_only:
+        filters.append(VehicleStock.quantity > 0)
+    return filters
+
+
 @router.post("/", response_model=VehicleStockSchema, status_code=status.HTTP_201_CREATED)
 async def create_vehicle_stock(
     stock_in: VehicleStockCreate,
@@ -76,12 +112,42 @@ async def create_vehicle_stock(
     
     stock = VehicleStock(**stock_in.model_dump())
     db.add(stock)
+    await db.flush()
+    await _sync_stock_to_excel(db, stock)
     await db.commit()
     await db.refresh(stock)
-    await _sync_stock_to_excel(db, stock)
     return stock
 
 
+@router.get("/export", response_class=FileResponse)
+async def export_vehicle_stock(
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Download the Excel snapshot, regenerated only when vehicle stock has changed."""
+    check_admin(current_user)
+    service = ExcelSyncService(db, Path(settings.EXCEL_INVENTORY_PATH))
+    version = await service.export_version()
+    headers = {"ETag": version.etag, "Cache-Control": "private, no-cache"}
+    if version.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(version.last_modified, usegmt=True)
+    if if_none_match and _etag_matches(if_none_match, version.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    export_dir = Path("storage/exports")
+    export_dir.mkdir(parents=True, exist_ok=True)
+    export_path = await service.cached_snapshot(export_dir, settings.EXCEL_EXPORT_FILENAME, version)
+    return FileResponse(export_path, filename=settings.EXCEL_EXPORT_FILENAME, headers=headers)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
 @router.get("/{stock_id}", response_model=VehicleStockSchema)
 async def get_vehicle_stock(
     stock_id: int,
@@ -118,9 +184,9 @@ async def update_vehicle_stock(
     for field, value in update_data.items():
         setattr(stock, field, value)
     
+    await _sync_stock_to_excel(db, stock)
     await db.commit()
     await db.refresh(stock)
-    await _sync_stock_to_excel(db, stock)
     return stock
 
 
@@ -149,9 +215,9 @@ async def adjust_vehicle_stock(
         )
     
     stock.quantity = new_quantity
+    await _sync_stock_to_excel(db, stock)
     await db.commit()
     await db.refresh(stock)
-    await _sync_stock_to_excel(db, stock)
     return stock
 
 
@@ -189,25 +255,34 @@ async def import_vehicle_stock(
         "created": summary.created,
         "updated": summary.updated,
         "removed": summary.removed,
+        "unchanged": summary.unchanged,
+        "max_loop_lag_ms": summary.max_loop_lag_ms,
         "workbook": export_path.name,
     }
 
 
-@router.get("/export", response_class=FileResponse)
-async def export_vehicle_stock(
+@router.post("/shards")
+async def export_vehicle_stock_shards(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Generate and download the latest Excel snapshot."""
+    """Rewrite the per-branch inventory workbooks and their index from the database (admin only)."""
     check_admin(current_user)
-    export_dir = Path("storage/exports")
-    export_dir.mkdir(parents=True, exist_ok=True)
-    export_path = export_dir / settings.EXCEL_EXPORT_FILENAME
+    if not settings.EXCEL_SHARD_DIR:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Sharded Excel inventory is not enabled")
+
     service = ExcelSyncService(db, Path(settings.EXCEL_INVENTORY_PATH))
-    await service.export_snapshot(export_path)
-    return FileResponse(export_path, filename=settings.EXCEL_EXPORT_FILENAME)
+    index = await service.export_shards()
+    return {
+        "generated_at": index.generated_at,
+        "shards": [
+            {"branch_code": shard.branch_code, "workbook": shard.filename, "rows": shard.rows}
+            for shard in index.shards
+        ],
+    }
 
 
 async def _sync_stock_to_excel(db: AsyncSession, stock: VehicleStock) -> None:
+    # Queued with the route's transaction; written to the workbook once it commits.
     service = ExcelSyncService(db, Path(settings.EXCEL_INVENTORY_PATH))
     await service.push_stock_update(stock)
@@ -13,6 +13,18 @@ class Settings(BaseSettings):
 
     EXCEL_INVENTORY_PATH: str = "storage/imports/honda_showrooms_kerala_data_v2.xlsx"
     EXCEL_EXPORT_FILENAME: str = "honda_live_inventory.xlsx"
+    EXCEL_WRITEBACK_INTERVAL_MS: int = 500
+    EXCEL_WRITEBACK_MAX_BATCH: int = 200
+    EXCEL_SYNC_BATCH_SIZE: int = 200
+    EXCEL_SYNC_QUEUE_DEPTH: int = 4
+    EXCEL_SYNC_LOOP_LAG_TARGET_MS: int = 100
+    EXCEL_SHARD_DIR: str | None = None
+    EXCEL_SHARD_WORKERS: int | None = None
+
+    IMPORT_CHUNK_SIZE: int = 1000
+    IMPORT_MAX_UPLOAD_BYTES: int = 256 * 1024 * 1024
+    IMPORT_PARSE_WORKERS: int | None = None
+    IMPORT_ERROR_SAMPLE_SIZE: int = 50
 
     POSTGRES_SERVER: str = "db"
     POSTGRES_PORT: int = 5432
@@ -25,6 +37,7 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://redis:6379/0"
     CELERY_BROKER_URL: str | None = None
     CELERY_RESULT_BACKEND: str | None = None
+    CELERY_TASK_ALWAYS_EAGER: bool = False
 
     JWT_SECRET_KEY: str = "change-me"
     JWT_REFRESH_SECRET_KEY: str = "change-me-refresh"
@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.v1.router import api_router
 from app.core.config import settings
+from app.services.excel_sync import drain_excel_writers
 from app.utils.logging import setup_logging
 
 
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    yield
+    # Pending workbook write-backs are flushed before the process exits.
+    await drain_excel_writers()
+
+
 def create_application() -> FastAPI:
     setup_logging()
 
@@ -16,6 +27,7 @@ def create_application() -> FastAPI:
         version="0.1.0",
         docs_url=f"{settings.API_V1_STR}/docs" if settings.EXPOSE_DOCS else None,
         openapi_url=f"{settings.API_V1_STR}/openapi.json" if settings.EXPOSE_DOCS else None,
+        lifespan=lifespan,
     )
 
     application.add_middleware(
@@ -1,7 +1,7 @@
 from app.models.anomaly import Anomaly
 from app.models.audit_event import AuditEvent
 from app.models.branch import Branch
-from app.models.import_log import ImportJob
+from app.models.import_log import ImportJob, ImportRowDigest
 from app.models.inventory import Inventory
 from app.models.payment import Payment
 from app.models.role import Role, UserRole as RoleModel
@@ -13,6 +13,7 @@ from app.models.vehicle_model import VehicleModel
 # New sales tracking models
 from app.models.customer import Customer
 from app.models.vehicle_stock import VehicleStock
+from app.models.excel_sync_state import ExcelSyncState
 from app.models.sales_record import SalesRecord, PaymentMode
 
 
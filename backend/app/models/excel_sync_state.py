@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import datetime as dt
+
+from sqlalchemy import BigInteger, DateTime, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class ExcelSyncState(Base):
+    """Fingerprint of a workbook as of its last successful sync into ``vehicle_stock``."""
+
+    __tablename__ = "excel_sync_states"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    workbook_path: Mapped[str] = mapped_column(String(500), unique=True, nullable=False)
+    file_mtime_ns: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    file_size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    file_sha256: Mapped[str] = mapped_column(String(64), nullable=False)
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    synced_at: Mapped[dt.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
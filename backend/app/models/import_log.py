@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import JSON, DateTime, ForeignKey, String, func
+from sqlalchemy import JSON, DateTime, ForeignKey, Index, Integer, String, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
@@ -15,8 +15,32 @@ class ImportJob(TimestampMixin, Base):
     uploaded_by_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"))
     source_filename: Mapped[str] = mapped_column(String(255), nullable=False)
     sheet_name: Mapped[str | None] = mapped_column(String(120))
+    sheet_names: Mapped[list[str] | None] = mapped_column(JSON, default=None)
     status: Mapped[str] = mapped_column(String(30), default="pending", nullable=False)
+    file_sha256: Mapped[str | None] = mapped_column(String(64), index=True)
+    checkpoint_row: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    ingest_backend: Mapped[str] = mapped_column(String(20), default="orm", nullable=False)
     summary: Mapped[dict | None] = mapped_column(JSON, default=None)
     executed_at: Mapped[str | None] = mapped_column(DateTime(timezone=True))
 
     branch = relationship("Branch")
+
+
+class ImportRowDigest(Base):
+    """Digest of the last successfully imported row for each branch/model pair.
+
+    ``cleared_at`` is set once the inventory the row produced is changed outside an
+    import; the digest is then ignored until the row is imported again.
+    """
+
+    __tablename__ = "import_row_digests"
+    __table_args__ = (Index("ix_import_row_digests_branch_model", "branch_code", "model_code", unique=True),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    branch_code: Mapped[str] = mapped_column(String(20), nullable=False)
+    model_code: Mapped[str] = mapped_column(String(50), nullable=False)
+    digest: Mapped[str] = mapped_column(String(32), nullable=False)
+    cleared_at: Mapped[str | None] = mapped_column(DateTime(timezone=True))
+    updated_at: Mapped[str] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
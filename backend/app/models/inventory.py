@@ -1,14 +1,20 @@
 from __future__ import annotations
 
-from sqlalchemy import ForeignKey, Integer
+from datetime import datetime, timezone
+
+from sqlalchemy import ForeignKey, Index, Integer, event, inspect, select, update
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
+from app.models.branch import Branch
 from app.models.common import TimestampMixin
+from app.models.import_log import ImportRowDigest
+from app.models.vehicle_model import VehicleModel
 
 
 class Inventory(TimestampMixin, Base):
     __tablename__ = "inventories"
+    __table_args__ = (Index("ix_inventories_branch_model", "branch_id", "model_id", unique=True),)
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     branch_id: Mapped[int] = mapped_column(ForeignKey("branches.id"), nullable=False, index=True)
@@ -18,3 +24,31 @@ class Inventory(TimestampMixin, Base):
 
     branch: Mapped["Branch"] = relationship(back_populates="inventories")
     model: Mapped["VehicleModel"] = relationship(back_populates="inventories")
+
+
+@event.listens_for(Inventory, "after_insert")
+@event.listens_for(Inventory, "after_delete")
+def _clear_row_digest(mapper, connection, target: Inventory) -> None:
+    """Inventory changed outside an import no longer matches its last imported row.
+
+    Imports write inventory with Core upserts, so only other writers clear the
+    digest, and re-uploading the same row applies it again.
+    """
+    connection.execute(
+        update(ImportRowDigest)
+        .where(
+            ImportRowDigest.branch_code
+            == select(Branch.code).where(Branch.id == target.branch_id).scalar_subquery(),
+            ImportRowDigest.model_code
+            == select(VehicleModel.external_code).where(VehicleModel.id == target.model_id).scalar_subquery(),
+            ImportRowDigest.cleared_at.is_(None),
+        )
+        .values(cleared_at=datetime.now(timezone.utc))
+    )
+
+
+@event.listens_for(Inventory, "after_update")
+def _clear_updated_row_digest(mapper, connection, target: Inventory) -> None:
+    state = inspect(target)
+    if state.attrs.quantity.history.has_changes() or state.attrs.reserved.history.has_changes():
+        _clear_row_digest(mapper, connection, target)
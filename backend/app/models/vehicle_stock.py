@@ -32,6 +32,7 @@ class VehicleStock(TimestampMixin, Base):
     latitude: Mapped[float | None] = mapped_column(Float, nullable=True)
     longitude: Mapped[float | None] = mapped_column(Float, nullable=True)
     last_synced_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    excel_row_digest: Mapped[str | None] = mapped_column(String(32), nullable=True)
     
     # Relationships
     sales: Mapped[list[SalesRecord]] = relationship("SalesRecord", back_populates="vehicle_stock")
@@ -1,16 +1,23 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Any, Literal
 
 from pydantic import BaseModel
 
 from app.schemas.base import ORMModel
 
+# "orm" applies rows chunk by chunk; "copy" bulk-loads a staging table and merges set-wise.
+IngestBackend = Literal["orm", "copy"]
+
 
 class ImportJobCreate(BaseModel):
     source_filename: str
     branch_id: int | None = None
     sheet_name: str | None = None
+    sheet_names: list[str] | None = None
+    all_sheets: bool = False
+    ingest_backend: IngestBackend = "orm"
 
 
 class ImportJobRead(ORMModel):
@@ -19,8 +26,44 @@ class ImportJobRead(ORMModel):
     uploaded_by_id: int | None
     source_filename: str
     sheet_name: str | None
+    sheet_names: list[str] | None
     status: str
+    file_sha256: str | None
+    checkpoint_row: int
+    ingest_backend: str
     summary: dict | None
     executed_at: datetime | None
     created_at: datetime
     updated_at: datetime
+
+
+class ImportPreview(BaseModel):
+    source_filename: str
+    sheet_name: str | None
+    sheet_names: list[str]
+    header: list[Any]
+    mapping: dict[str, int]
+    missing_required_fields: list[str]
+    missing_optional_fields: list[str]
+    unmapped_columns: list[str]
+    rows: list[list[Any]]
+    estimated_rows: int | None
+
+
+class Percentiles(BaseModel):
+    p50: float | None
+    p95: float | None
+
+
+class ImportStageMetrics(BaseModel):
+    seconds: Percentiles
+    rows_per_second: Percentiles
+
+
+class ImportMetricsBucket(BaseModel):
+    size_bucket: str
+    jobs: int
+    total_seconds: Percentiles
+    rows_per_second: Percentiles
+    round_trips: Percentiles
+    stages: dict[str, ImportStageMetrics]
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+INDEX_FILENAME = "index.json"
+
+# Each shard owns a block of ``excel_row_number`` values as large as a worksheet can
+# be tall, so ``row_base + sheet row`` stays globally unique and a row number alone
+# tells which shard holds it. Block 0 is left to the single canonical workbook.
+SHARD_ROW_SPAN = 1 << 20
+
+UNASSIGNED_SHARD = "_unassigned"
+
+
+@dataclass(frozen=True, slots=True)
+class Shard:
+    branch_code: str | None
+    filename: str
+    row_base: int
+    rows: int = 0
+
+    def row_number(self, sheet_row: int) -> int:
+        return self.row_base + sheet_row
+
+    def sheet_row(self, row_number: int) -> int:
+        return row_number - self.row_base
+
+
+@dataclass
+class ShardIndex:
+    """The per-branch workbooks of a sharded inventory, persisted as ``index.json``."""
+
+    shard_dir: Path
+    shards: list[Shard] = field(default_factory=list)
+    generated_at: str | None = None
+
+    @property
+    def path(self) -> Path:
+        return self.shard_dir / INDEX_FILENAME
+
+    def workbook_path(self, shard: Shard) -> Path:
+        return self.shard_dir / shard.filename
+
+    def shard_for_row(self, row_number: int) -> Shard | None:
+        base = row_number - row_number % SHARD_ROW_SPAN
+        return next((shard for shard in self.shards if shard.row_base == base), None)
+
+    def shard_for_branch(self, branch_code: str | None) -> Shard | None:
+        return next((shard for shard in self.shards if shard.branch_code == branch_code), None)
+
+    def add_shard(self, branch_code: str | None) -> Shard:
+        """Register an empty shard for a branch with no workbook yet and save the index."""
+        shard = Shard(
+            branch_code=branch_code,
+            filename=shard_filename(branch_code, {shard.filename.lower() for shard in self.shards}),
+            row_base=max((shard.row_base for shard in self.shards), default=0) + SHARD_ROW_SPAN,
+        )
+        self.shards.append(shard)
+        self.save()
+        return shard
+
+    @classmethod
+    def load(cls, shard_dir: Path) -> ShardIndex | None:
+        """The index in ``shard_dir``, cached until the file changes; ``None`` if there is none yet."""
+        path = shard_dir / INDEX_FILENAME
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        key = path.resolve()
+        cached = _index_cache.get(key)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+        data = json.loads(path.read_text(encoding="utf-8"))
+        index = cls(
+            shard_dir=shard_dir,
+            shards=[Shard(**entry) for entry in data.get("shards", [])],
+            generated_at=data.get("generated_at"),
+        )
+        _index_cache[key] = (mtime_ns, index)
+        return index
+
+    def save(self) -> None:
+        self.generated_at = datetime.now(timezone.utc).isoformat()
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f".{self.path.name}.tmp")
+        temp_path.write_text(
+            json.dumps({"generated_at": self.generated_at, "shards": [asdict(shard) for shard in self.shards]}, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(temp_path, self.path)
+        _index_cache[self.path.resolve()] = (self.path.stat().st_mtime_ns, self)
+
+
+_index_cache: dict[Path, tuple[int, ShardIndex]] = {}
+
+
+def shard_filename(branch_code: str | None, taken: set[str]) -> str:
+    """A file name for the branch's workbook that no other shard in ``taken`` uses."""
+    stem = re.sub(r"[^A-Za-z0-9_.-]+", "_", branch_code).strip("._") if branch_code else ""
+    stem = stem or UNASSIGNED_SHARD
+    filename = f"{stem}.xlsx"
+    suffix = 2
+    while filename.lower() in taken:
+        filename = f"{stem}-{suffix}.xlsx"
+        suffix += 1
+    return filename
@@ -1,17 +1,42 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
-from datetime import datetime
+import hashlib
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import aclosing
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterator, Sequence
 
 from openpyxl import Workbook, load_workbook
 from openpyxl.utils import get_column_letter
-from sqlalchemy import delete, select
+from sqlalchemy import Column, Integer, MetaData, Table, delete, event, exists, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable, DropTable
 
-from app.models import Branch, VehicleStock
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models import Branch, ExcelSyncState, VehicleStock
+from app.services.excel_shards import SHARD_ROW_SPAN, Shard, ShardIndex, shard_filename
+from app.services.import_metrics import LoopLagMonitor
 
+logger = logging.getLogger(__name__)
+
+# All in-process openpyxl work (sync reads, write-backs, exports) runs on this one
+# thread, so it never competes with the event loop and never touches a workbook
+# concurrently. Only whole-layout shard reads and rewrites fan out to processes.
+_workbook_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="excel-workbook")
 
 EXCEL_HEADERS = [
     "branch_code",
@@ -27,6 +52,18 @@ EXCEL_HEADERS = [
     "reserved",
 ]
 
+_ROW_KEY_COLUMNS = tuple(EXCEL_HEADERS.index(name) for name in ("branch_code", "model_code", "variant", "color"))
+
+# Kept off the application metadata so ``create_all`` and Alembic never see it.
+_sync_metadata = MetaData()
+
+seen_rows_table = Table(
+    "excel_sync_seen_rows",
+    _sync_metadata,
+    Column("row_no", Integer, primary_key=True, autoincrement=False),
+    prefixes=["TEMPORARY"],
+)
+
 
 @dataclass
 class ImportSummary:
@@ -34,128 +71,1103 @@ class ImportSummary:
     created: int = 0
     updated: int = 0
     removed: int = 0
+    unchanged: int = 0
+    max_loop_lag_ms: float = 0.0
+
+
+RowKey = tuple[str | None, str | None, str | None, str | None]
+
+
+@dataclass(frozen=True, slots=True)
+class StockRowUpdate:
+    """Values written back to one workbook row, captured when the change is made.
+
+    ``values`` holds the whole row in ``EXCEL_HEADERS`` order when the row is new
+    to the workbook; otherwise only the four tracked cells are written. ``row`` is
+    the sheet row, ``row_base`` the start of the workbook's row block.
+    """
+
+    row: int
+    quantity: int
+    reserved: int
+    branch_name: str | None
+    city: str | None
+    values: tuple | None = None
+    stock_id: int | None = None
+    row_base: int = 0
+
+    @classmethod
+    def from_stock(cls, stock: VehicleStock, full_row: bool = False) -> StockRowUpdate:
+        return cls(
+            row=stock.excel_row_number,
+            quantity=int(stock.quantity),
+            reserved=int(stock.reserved),
+            branch_name=stock.branch_name,
+            city=stock.city,
+            values=_stock_row_values(stock) if full_row else None,
+            stock_id=stock.id,
+        )
+
+
+@dataclass
+class ExcelRowIndex:
+    """Workbook row of each ``(branch_code, model_code, variant, color)`` in one workbook.
+
+    Rebuilt from the rows read by every full sync, and otherwise from the row
+    numbers stored on the stock rows. ``claimed`` holds rows handed out since,
+    whose numbers may not be committed yet.
+    """
+
+    rows: dict[RowKey, int]
+    next_row: int
+    claimed: set[int] = field(default_factory=set)
+
+    def add(self, key: RowKey, row: int) -> None:
+        self.rows.setdefault(key, row)
+        if row >= self.next_row:
+            self.next_row = row + 1
+
+    def allocate(self) -> int:
+        row = self.next_row
+        self.next_row += 1
+        self.claimed.add(row)
+        return row
+
+
+@dataclass(frozen=True, slots=True)
+class ExportVersion:
+    """Version stamp of ``vehicle_stock``: row count, highest id and latest ``updated_at``.
+
+    Inserts and deletes move the count or id; updates bump ``updated_at``, so two
+    edits within the database clock's resolution (a second on SQLite) share a stamp.
+    """
+
+    rows: int
+    max_id: int | None
+    last_modified: datetime | None
+
+    @property
+    def tag(self) -> str:
+        stamp = f"{self.rows}:{self.max_id}:{self.last_modified.isoformat() if self.last_modified else ''}"
+        return hashlib.sha1(stamp.encode()).hexdigest()[:20]
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.tag}"'
+
+
+class ExcelWriteBack:
+    """Single background writer that batches stock write-backs into one workbook save.
+
+    Updates are coalesced per row (the latest wins) and flushed with one
+    load/save once ``EXCEL_WRITEBACK_INTERVAL_MS`` has passed since the first
+    pending update, or as soon as ``EXCEL_WRITEBACK_MAX_BATCH`` rows are waiting.
+    The workbook is replaced atomically so readers never see a partial file.
+    """
+
+    def __init__(self, workbook_path: Path) -> None:
+        self.workbook_path = workbook_path
+        self._pending: dict[int, StockRowUpdate] = {}
+        # Sheet rows appended elsewhere because their row was in use, until the
+        # stock rows point at the new ones.
+        self._moved_rows: dict[int, int] = {}
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._has_work: asyncio.Event | None = None
+        self._flush_now: asyncio.Event | None = None
+        self._closing = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, update: StockRowUpdate) -> None:
+        pending = self._pending.get(update.row)
+        if pending is not None and pending.values is not None and update.values is None:
+            # A row still waiting to be appended keeps its full values under later updates.
+            update = replace(update, values=pending.values)
+        self._pending[update.row] = update
+        self._ensure_running()
+        self._has_work.set()
+        if len(self._pending) >= settings.EXCEL_WRITEBACK_MAX_BATCH:
+            self._flush_now.set()
+
+    async def drain(self) -> None:
+        """Flush everything still pending and stop the writer task."""
+        task = self._task
+        if task is not None and not task.done() and self._loop is asyncio.get_running_loop():
+            self._closing = True
+            self._flush_now.set()
+            self._has_work.set()
+            await task
+        elif self._pending:
+            self._closing = True
+            await self._flush()
+        self._closing = False
+        self._task = None
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        # Events are bound to the loop they are first awaited on, so each loop gets its own.
+        self._loop = loop
+        self._has_work = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._task = loop.create_task(self._run(), name=f"excel-writeback:{self.workbook_path.name}")
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_work.wait()
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=settings.EXCEL_WRITEBACK_INTERVAL_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush()
+            if self._closing and not self._pending:
+                return
+
+    async def _flush(self) -> None:
+        if self._has_work is not None:
+            self._has_work.clear()
+            self._flush_now.clear()
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        try:
+            moved = await run_in_workbook_worker(self._write, list(batch.values()))
+        except Exception:
+            logger.exception("Writing %d stock updates to %s failed", len(batch), self.workbook_path)
+            if self._closing:
+                return
+            # Retry on the next interval unless a newer value for the row has arrived meanwhile.
+            for row, update in batch.items():
+                newer = self._pending.setdefault(row, update)
+                if newer.values is None and update.values is not None:
+                    self._pending[row] = replace(newer, values=update.values)
+            self._has_work.set()
+            return
+        if moved:
+            await self._record_moved_rows(moved)
+
+    def _write(self, updates: list[StockRowUpdate]) -> list[tuple[StockRowUpdate, int]]:
+        """Write ``updates`` and return the full-row ones that went to another row than asked.
+
+        A full row only goes to its row if that row is empty or holds the same
+        branch/model/variant/color; otherwise (staff added a row there in Excel)
+        it is appended after the sheet's last row.
+        """
+        if self.workbook_path.exists():
+            workbook = load_workbook(self.workbook_path)
+        else:
+            workbook = Workbook()
+            workbook.active.title = "Inventory"
+            workbook.active.append(EXCEL_HEADERS)
+
+        moved: list[tuple[StockRowUpdate, int]] = []
+        try:
+            worksheet = workbook.active
+            targets = {update.row for update in updates}
+            next_row = worksheet.max_row + 1
+            for update in updates:
+                row = self._moved_rows.get(update.row, update.row)
+                if update.values is not None:
+                    if not _row_fits(worksheet, row, update.values):
+                        while next_row in targets:
+                            next_row += 1
+                        row, next_row = next_row, next_row + 1
+                        moved.append((update, row))
+                    # Assigned explicitly: ``cell(value=None)`` would leave the old value in place.
+                    for column, value in enumerate(update.values, start=1):
+                        worksheet.cell(row=row, column=column).value = value
+                worksheet.cell(row=row, column=EXCEL_HEADERS.index("quantity") + 1).value = update.quantity
+                worksheet.cell(row=row, column=EXCEL_HEADERS.index("reserved") + 1).value = update.reserved
+                worksheet.cell(row=row, column=EXCEL_HEADERS.index("branch_name") + 1).value = update.branch_name
+                worksheet.cell(row=row, column=EXCEL_HEADERS.index("city") + 1).value = update.city
+
+            _save_atomically(workbook, self.workbook_path)
+        finally:
+            workbook.close()
+        self._moved_rows.update((update.row, row) for update, row in moved)
+        return moved
+
+    async def _record_moved_rows(self, moved: list[tuple[StockRowUpdate, int]]) -> None:
+        """Point the stock rows (and the row index) at the rows their values were appended to."""
+        row_index = _row_indexes.get(self.workbook_path.resolve())
+        try:
+            async with AsyncSessionLocal() as session:
+                for stock_update, row in moved:
+                    await session.execute(
+                        update(VehicleStock)
+                        .where(VehicleStock.id == stock_update.stock_id)
+                        .values(excel_row_number=stock_update.row_base + row)
+                    )
+                await session.commit()
+        except Exception:
+            # The next full sync reads the rows back from the sheet either way.
+            logger.exception("Recording the rows appended to %s failed", self.workbook_path)
+            return
+        for stock_update, row in moved:
+            self._moved_rows.pop(stock_update.row, None)
+            if row_index is not None:
+                row_index.rows[_sheet_row_key(stock_update.values)] = stock_update.row_base + row
+                row_index.next_row = max(row_index.next_row, stock_update.row_base + row + 1)
+
+
+_writers: dict[Path, ExcelWriteBack] = {}
+
+
+def get_excel_writer(workbook_path: Path) -> ExcelWriteBack:
+    """The process-wide writer for a workbook; one per file so saves never overlap."""
+    key = workbook_path.resolve()
+    writer = _writers.get(key)
+    if writer is None:
+        writer = _writers[key] = ExcelWriteBack(workbook_path)
+    return writer
+
+
+async def drain_excel_writers() -> None:
+    for writer in list(_writers.values()):
+        await writer.drain()
+
+
+_row_indexes: dict[Path, ExcelRowIndex] = {}
+
+# ``Session.info`` key of the write-backs waiting for their transaction to commit.
+_PENDING_WRITE_BACKS = "excel_write_backs"
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_write_backs(session: Session) -> None:
+    """Hand a committed transaction's write-backs to the workbook writers."""
+    if session.get_nested_transaction() is not None:
+        return
+    for workbook_path, stock_update in session.info.pop(_PENDING_WRITE_BACKS, ()):
+        get_excel_writer(workbook_path).enqueue(stock_update)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_write_backs(session: Session, transaction) -> None:
+    # Whatever is left when the outermost transaction ends was rolled back.
+    if transaction.parent is None:
+        session.info.pop(_PENDING_WRITE_BACKS, None)
+
+
+def forget_row_indexes() -> None:
+    _row_indexes.clear()
+
+
+async def run_in_workbook_worker(func: Callable[..., Any], *args: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_workbook_executor, partial(func, *args))
+
+
+class _StopReading(Exception):
+    pass
+
+
+def _save_atomically(workbook: Workbook, path: Path) -> None:
+    temp_path = path.with_name(f".{path.name}.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    workbook.save(temp_path)
+    os.replace(temp_path, path)
+
+
+class _SnapshotWriter:
+    """Measures export rows as they stream in and spools them to a temporary file.
+
+    Write-only worksheets emit column widths before the first row, so widths are
+    taken from the same pass that formats the rows, and the spooled rows are
+    replayed into the workbook once those widths are known.
+    """
+
+    def __init__(self) -> None:
+        self.widths = [len(header) for header in EXCEL_HEADERS]
+        self.rows = 0
+        self._spool = tempfile.TemporaryFile()
+
+    def add_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        """Add rows whose first columns are the ``EXCEL_HEADERS`` values, in that order."""
+        batch = []
+        widths = self.widths
+        for row in rows:
+            values = (
+                *row[:3],
+                _round_coordinate(row[3]),
+                _round_coordinate(row[4]),
+                *row[5:9],
+                int(row[9]),
+                int(row[10]),
+            )
+            for idx, value in enumerate(values):
+                if value is not None:
+                    length = len(str(value))
+                    if length > widths[idx]:
+                        widths[idx] = length
+            batch.append(values)
+        pickle.dump(batch, self._spool, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows += len(batch)
+
+    def save(self, path: Path) -> None:
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet("Inventory")
+        for idx, width in enumerate(self.widths, start=1):
+            worksheet.column_dimensions[get_column_letter(idx)].width = max(width + 2, 12)
+        worksheet.freeze_panes = "A2"
+        worksheet.append(EXCEL_HEADERS)
+
+        self._spool.seek(0)
+        while True:
+            try:
+                batch = pickle.load(self._spool)
+            except EOFError:
+                break
+            for values in batch:
+                worksheet.append(values)
+        _save_atomically(workbook, path)
+
+    def close(self) -> None:
+        self._spool.close()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _workbooks_sha256(paths: list[Path]) -> str:
+    """Content hash of a set of workbooks; a single workbook keeps its plain file hash."""
+    if len(paths) == 1:
+        return _file_sha256(paths[0])
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(f"{path.name}:{_file_sha256(path)}\n".encode())
+    return digest.hexdigest()
+
+
+def _workbooks_stat(paths: list[Path]) -> tuple[int, int]:
+    """Newest mtime and total size of a set of workbooks."""
+    stats = [path.stat() for path in paths]
+    return max((stat.st_mtime_ns for stat in stats), default=0), sum(stat.st_size for stat in stats)
+
+
+def _parse_shard(path: str, row_base: int) -> list[tuple[int, str, dict]]:
+    """Process-pool entry point for reading one shard workbook."""
+    return list(ExcelSyncService._iter_workbook_rows(Path(path), row_base))
+
+
+def _write_shard(path: str, rows: list[tuple]) -> None:
+    """Process-pool entry point for writing one shard workbook."""
+    snapshot = _SnapshotWriter()
+    try:
+        snapshot.add_rows(rows)
+        snapshot.save(Path(path))
+    finally:
+        snapshot.close()
+
+
+def _row_digest(header_key: str, row: tuple) -> str:
+    payload = header_key + "\x1d" + "\x1f".join(map(str, row))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+@event.listens_for(VehicleStock, "before_update")
+def _forget_row_digest(mapper, connection, target: VehicleStock) -> None:
+    """A row edited outside the Excel sync no longer matches its workbook digest."""
+    state = inspect(target)
+    if state.attrs.excel_row_digest.history.has_changes():
+        return
+    if any(state.attrs[attr.key].history.has_changes() for attr in mapper.column_attrs):
+        target.excel_row_digest = None
+
+
+def _round_coordinate(value) -> float | None:
+    if value is None:
+        return None
+    return round(float(value), 6)
+
+
+def _sheet_row_key(values: Sequence[Any]) -> RowKey:
+    return tuple(ExcelSyncService._safe_str(values[column]) for column in _ROW_KEY_COLUMNS)
+
+
+def _row_fits(worksheet, row: int, values: Sequence[Any]) -> bool:
+    """Whether ``values`` can be written to ``row``: it is empty or holds the same stock key."""
+    if row > worksheet.max_row:
+        return True
+    cells = [worksheet.cell(row=row, column=column).value for column in range(1, len(EXCEL_HEADERS) + 1)]
+    if all(value in (None, "") for value in cells):
+        return True
+    return _sheet_row_key(cells) == _sheet_row_key(values)
+
+
+def _row_key(row: VehicleStock | dict) -> RowKey:
+    if isinstance(row, dict):
+        return row["branch_code"], row["model_code"], row["variant"], row["color"]
+    return row.branch_code, row.model_code, row.variant, row.color
+
+
+def _stock_row_values(stock: VehicleStock) -> tuple:
+    """The stock row as workbook cells, formatted like a snapshot export."""
+    return (
+        stock.branch_code,
+        stock.branch_name,
+        stock.city,
+        _round_coordinate(stock.latitude),
+        _round_coordinate(stock.longitude),
+        stock.model_code,
+        stock.model_name,
+        stock.variant,
+        stock.color,
+        int(stock.quantity),
+        int(stock.reserved),
+    )
 
 
 class ExcelSyncService:
-    """Synchronise vehicle stock with the canonical Excel workbook."""
+    """Synchronise vehicle stock with the canonical Excel workbook.
 
-    def __init__(self, session: AsyncSession, workbook_path: Path) -> None:
+    With ``EXCEL_SHARD_DIR`` set, stock lives in one workbook per branch code under
+    that directory instead, listed in a generated ``index.json``.
+    """
+
+    def __init__(self, session: AsyncSession, workbook_path: Path, shard_dir: Path | None = None) -> None:
         self.session = session
         self.workbook_path = workbook_path
+        if shard_dir is None and settings.EXCEL_SHARD_DIR:
+            shard_dir = Path(settings.EXCEL_SHARD_DIR)
+        self.shard_dir = shard_dir
 
     async def import_inventory(self) -> ImportSummary:
-        """Load or refresh vehicle stock entries from the Excel sheet."""
-        workbook = await self._load_workbook()
-        worksheet = workbook.active
+        """Load or refresh vehicle stock entries from the Excel sheet, or from every shard.
+
+        The first sync of a sharded layout imports the canonical workbook and then
+        splits the result into shards with ``export_shards``.
+        """
+        if self.shard_dir is None:
+            return await self._sync_workbooks(self.workbook_path, [(self.workbook_path, 0)])
 
-        header = [cell for cell in next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True))]
-        normalized = [self._normalize(value) for value in header]
+        index = ShardIndex.load(self.shard_dir)
+        if index is None:
+            summary = await self._sync_workbooks(self.workbook_path, [(self.workbook_path, 0)])
+            await self.export_shards()
+            return summary
+        return await self._sync_workbooks(
+            index.path, [(index.workbook_path(shard), shard.row_base) for shard in index.shards]
+        )
+
+    async def _sync_workbooks(self, state_path: Path, sources: list[tuple[Path, int]]) -> ImportSummary:
+        """Sync stock with ``sources``, ``(workbook, row base)`` pairs tracked together under ``state_path``.
+
+        Workbooks whose size and mtime, or failing that content hash, match the last
+        sync are not read at all, as long as no synced row was edited or removed in the
+        app since. Otherwise only rows whose digest differs from the one stored on
+        the stock row are applied; the rest are counted as ``unchanged``.
+        """
+        paths = [path for path, _ in sources]
+        for path in paths:
+            # Queued write-backs must land first, otherwise the sheet would roll them back.
+            await get_excel_writer(path).drain()
+            await self._ensure_workbook(path)
+
+        mtime_ns, size = _workbooks_stat(paths)
+        sync_state = await self.session.scalar(
+            select(ExcelSyncState).where(ExcelSyncState.workbook_path == str(state_path.resolve()))
+        )
+        if sync_state is not None and await self._rows_in_sync(sync_state.row_count):
+            if (mtime_ns, size) == (sync_state.file_mtime_ns, sync_state.file_size):
+                return ImportSummary(processed=sync_state.row_count, unchanged=sync_state.row_count)
+        file_sha256 = await asyncio.to_thread(_workbooks_sha256, paths)
+        if sync_state is not None and file_sha256 == sync_state.file_sha256:
+            if await self._rows_in_sync(sync_state.row_count):
+                sync_state.file_mtime_ns, sync_state.file_size = mtime_ns, size
+                await self.session.commit()
+                return ImportSummary(processed=sync_state.row_count, unchanged=sync_state.row_count)
 
         summary = ImportSummary()
         seen_rows: set[int] = set()
+        row_indexes: dict[int, ExcelRowIndex] = {}
+        async with LoopLagMonitor() as lag:
+            # Only ids and digests are preloaded; full rows are loaded per batch for the
+            # rows whose digest changed, so the session never holds the whole sheet.
+            synced = await self._load_synced_rows()
+            branches = await self._load_branches_by_code()
 
-        for offset, row in enumerate(
-            worksheet.iter_rows(min_row=2, values_only=True), start=2
-        ):
-            if not any(row):
-                continue
-
-            summary.processed += 1
-            row_data = {normalized[idx]: row[idx] for idx in range(len(normalized)) if idx < len(row)}
-            excel_row_number = offset
-            seen_rows.add(excel_row_number)
+            async with aclosing(self._row_batches(sources)) as batches:
+                async for batch in batches:
+                    stocks = await self._load_changed_stocks(batch, synced)
+                    for excel_row_number, digest, payload in batch:
+                        summary.processed += 1
+                        seen_rows.add(excel_row_number)
+                        row_base = excel_row_number - excel_row_number % SHARD_ROW_SPAN
+                        row_index = row_indexes.get(row_base)
+                        if row_index is None:
+                            row_index = row_indexes[row_base] = ExcelRowIndex({}, row_base + 2)
+                        row_index.add(_row_key(payload), excel_row_number)
+                        self._apply_row(excel_row_number, digest, payload, synced, stocks, branches, summary)
+                    await self.session.flush()
+                    # Let other requests in between batches even when the queue is already full.
+                    await asyncio.sleep(0)
 
-            stock = await self._get_stock_by_row(excel_row_number)
+            # Remove stale stock entries that no longer exist in the workbook.
+            if seen_rows:
+                summary.removed = await self._delete_stale_rows(seen_rows)
 
-            payload = self._payload_from_row(row_data, excel_row_number)
-            branch = await self._ensure_branch(payload)
+        summary.max_loop_lag_ms = lag.max_ms
+        if lag.max_ms > settings.EXCEL_SYNC_LOOP_LAG_TARGET_MS:
+            logger.warning(
+                "Excel sync of %s held the event loop for up to %.1fms (target %dms): %s",
+                state_path,
+                lag.max_ms,
+                settings.EXCEL_SYNC_LOOP_LAG_TARGET_MS,
+                lag.as_summary(),
+            )
 
-            if stock is None:
-                stock = VehicleStock(**payload)
-                self.session.add(stock)
-                summary.created += 1
-            else:
-                for field, value in payload.items():
-                    setattr(stock, field, value)
-                summary.updated += 1
-
-            if branch and stock:
-                stock.branch_code = branch.code
-                stock.branch_name = branch.name
-                stock.city = branch.city
-                stock.latitude = branch.latitude
-                stock.longitude = branch.longitude
-
-        await self.session.flush()
-
-        # Remove stale stock entries that no longer exist in the workbook.
-        if seen_rows:
-            stmt = delete(VehicleStock).where(VehicleStock.excel_row_number.notin(seen_rows))
-            result = await self.session.execute(stmt)
-            summary.removed = result.rowcount or 0
+        if sync_state is None:
+            sync_state = ExcelSyncState(workbook_path=str(state_path.resolve()))
+            self.session.add(sync_state)
+        sync_state.file_mtime_ns = mtime_ns
+        sync_state.file_size = size
+        sync_state.file_sha256 = file_sha256
+        sync_state.row_count = summary.processed
 
         await self.session.commit()
-        await asyncio.to_thread(workbook.close)
+        forget_row_indexes()
+        for path, row_base in sources:
+            _row_indexes[path.resolve()] = row_indexes.get(row_base) or ExcelRowIndex({}, row_base + 2)
         return summary
 
     async def push_stock_update(self, stock: VehicleStock) -> None:
-        """Write the latest quantity/reserved values back to the workbook."""
+        """Queue the latest quantity/reserved values for the writer of the workbook holding the row.
+
+        In a sharded layout that is the shard whose row block contains the row, so
+        only that branch's workbook is reloaded and saved. Stock without a workbook
+        row yet (created in the app) is first given one by ``_assign_row`` and the
+        whole row is queued to be appended. The update reaches the writer once the
+        caller commits the session, and is dropped if it rolls back instead.
+        """
         if stock.excel_row_number is None:
-            return
+            workbook_path, row_base = self._workbook_for_branch(stock.branch_code)
+            if not await self._assign_row(stock, workbook_path, row_base):
+                return
+            update = StockRowUpdate.from_stock(stock, full_row=True)
+        else:
+            update = StockRowUpdate.from_stock(stock)
+            target = self._workbook_for_row(update.row)
+            if target is None:
+                logger.warning("No Excel shard holds row %d; write-back of stock %s skipped", update.row, stock.id)
+                return
+            workbook_path, row_base = target
+
+        self.session.info.setdefault(_PENDING_WRITE_BACKS, []).append(
+            (workbook_path, replace(update, row=update.row - row_base, row_base=row_base))
+        )
+
+    def _workbook_for_row(self, row: int) -> tuple[Path, int] | None:
+        """The workbook holding ``row`` and the row base of its block."""
+        index = ShardIndex.load(self.shard_dir) if self.shard_dir is not None else None
+        shard = index.shard_for_row(row) if index is not None else None
+        if shard is not None:
+            return index.workbook_path(shard), shard.row_base
+        if row < SHARD_ROW_SPAN:
+            return self.workbook_path, 0
+        return None
+
+    def _workbook_for_branch(self, branch_code: str | None) -> tuple[Path, int]:
+        """The workbook new rows of ``branch_code`` go to, adding a shard for an unknown branch."""
+        index = ShardIndex.load(self.shard_dir) if self.shard_dir is not None else None
+        if index is None:
+            return self.workbook_path, 0
+        shard = index.shard_for_branch(branch_code) or index.add_shard(branch_code)
+        return index.workbook_path(shard), shard.row_base
+
+    async def _assign_row(self, stock: VehicleStock, workbook_path: Path, row_base: int) -> bool:
+        """Give ``stock`` a row in ``workbook_path``, flushed but left for the caller to commit.
+
+        That is the row its branch/model/variant/color had in the workbook, if no
+        other stock holds it, or else the next row after the last one in use. The
+        row is claimed in a savepoint, so if another process took it meanwhile the
+        write-back is skipped and the rest of the transaction is left alone.
+        """
+        row_index = await self._row_index(workbook_path, row_base)
+        key = _row_key(stock)
+        row = row_index.rows.get(key)
+        if row is not None and (row in row_index.claimed or await self._row_taken(row)):
+            row = None
+        if row is None or row in row_index.claimed:
+            row = row_index.allocate()
+            # Row numbers set through the API are not in the index; step over them.
+            while await self._row_taken(row):
+                row = row_index.allocate()
+        else:
+            row_index.claimed.add(row)
+        row_index.rows[key] = row
+
+        stock_id = stock.id
+        try:
+            # A collision only rolls back the savepoint, not the caller's pending changes.
+            async with self.session.begin_nested():
+                stock.excel_row_number = row
+        except IntegrityError:
+            _row_indexes.pop(workbook_path.resolve(), None)
+            await self.session.refresh(stock)
+            logger.warning("Workbook row %d for stock %s was taken meanwhile; write-back skipped", row, stock_id)
+            return False
+        # The flush expired the server-side updated_at.
+        await self.session.refresh(stock)
+        return True
 
-        workbook = await self._load_workbook()
-        worksheet = workbook.active
+    async def _row_index(self, workbook_path: Path, row_base: int) -> ExcelRowIndex:
+        key = workbook_path.resolve()
+        row_index = _row_indexes.get(key)
+        if row_index is not None:
+            return row_index
 
-        row_index = stock.excel_row_number
-        worksheet.cell(row=row_index, column=EXCEL_HEADERS.index("quantity") + 1, value=int(stock.quantity))
-        worksheet.cell(row=row_index, column=EXCEL_HEADERS.index("reserved") + 1, value=int(stock.reserved))
-        worksheet.cell(row=row_index, column=EXCEL_HEADERS.index("branch_name") + 1, value=stock.branch_name)
-        worksheet.cell(row=row_index, column=EXCEL_HEADERS.index("city") + 1, value=stock.city)
+        stmt = (
+            select(
+                VehicleStock.branch_code,
+                VehicleStock.model_code,
+                VehicleStock.variant,
+                VehicleStock.color,
+                VehicleStock.excel_row_number,
+            )
+            .where(
+                VehicleStock.excel_row_number >= row_base,
+                VehicleStock.excel_row_number < row_base + SHARD_ROW_SPAN,
+            )
+            .order_by(VehicleStock.excel_row_number)
+            .execution_options(yield_per=max(settings.IMPORT_CHUNK_SIZE, 1))
+        )
+        row_index = ExcelRowIndex({}, row_base + 2)
+        result = await self.session.stream(stmt)
+        async for partition in result.partitions():
+            for *row_key, row in partition:
+                row_index.add(tuple(row_key), row)
+        # Another push may have built it while the rows were streaming in.
+        return _row_indexes.setdefault(key, row_index)
 
-        await asyncio.to_thread(workbook.save, self.workbook_path)
-        await asyncio.to_thread(workbook.close)
+    async def _row_taken(self, row: int) -> bool:
+        return await self.session.scalar(select(VehicleStock.id).where(VehicleStock.excel_row_number == row)) is not None
 
     async def export_snapshot(self, target_path: Path | None = None) -> Path:
-        """Generate a fresh workbook from the current database state."""
+        """Generate a fresh workbook from the current database state.
+
+        Rows are streamed from the database in ``IMPORT_CHUNK_SIZE`` batches and
+        formatted and written in a worker thread, so memory stays flat however
+        large the inventory is.
+        """
         export_path = target_path or self.workbook_path
-        workbook = Workbook()
-        worksheet = workbook.active
+        stmt = (
+            select(
+                VehicleStock.branch_code,
+                VehicleStock.branch_name,
+                VehicleStock.city,
+                VehicleStock.latitude,
+                VehicleStock.longitude,
+                VehicleStock.model_code,
+                VehicleStock.model_name,
+                VehicleStock.variant,
+                VehicleStock.color,
+                VehicleStock.quantity,
+                VehicleStock.reserved,
+            )
+            .order_by(VehicleStock.branch_code, VehicleStock.model_name)
+            .execution_options(yield_per=max(settings.IMPORT_CHUNK_SIZE, 1))
+        )
 
-        worksheet.title = "Inventory"
-        worksheet.append(EXCEL_HEADERS)
+        snapshot = _SnapshotWriter()
+        try:
+            result = await self.session.stream(stmt)
+            async for partition in result.partitions():
+                await run_in_workbook_worker(snapshot.add_rows, partition)
+            await run_in_workbook_worker(snapshot.save, export_path)
+        finally:
+            snapshot.close()
+        return export_path
 
-        stmt = select(VehicleStock).order_by(
-            VehicleStock.branch_code, VehicleStock.model_name
-        )
-        result = await self.session.execute(stmt)
-        for stock in result.scalars():
-            worksheet.append([
-                stock.branch_code,
-                stock.branch_name,
-                stock.city,
-                self._round_float(stock.latitude),
-                self._round_float(stock.longitude),
-                stock.model_code,
-                stock.model_name,
-                stock.variant,
-                stock.color,
-                int(stock.quantity),
-                int(stock.reserved),
-            ])
-
-        self._autosize_columns(worksheet)
-        worksheet.freeze_panes = "A2"
+    async def export_version(self) -> ExportVersion:
+        stmt = select(func.count(), func.max(VehicleStock.id), func.max(VehicleStock.updated_at)).select_from(VehicleStock)
+        rows, max_id, last_modified = (await self.session.execute(stmt)).one()
+        if last_modified is not None and last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return ExportVersion(rows=rows, max_id=max_id, last_modified=last_modified)
+
+    async def cached_snapshot(self, export_dir: Path, filename: str, version: ExportVersion) -> Path:
+        """Return the snapshot for ``version``, exporting it only if it is not on disk yet.
 
-        await asyncio.to_thread(workbook.save, export_path)
-        await asyncio.to_thread(workbook.close)
+        Snapshots are stored as ``<stem>-<tag><suffix>``; older versions are removed
+        once a newer one has been written, keeping the previous one for downloads
+        that may still be in flight.
+        """
+        stem, suffix = Path(filename).stem, Path(filename).suffix
+        export_path = export_dir / f"{stem}-{version.tag}{suffix}"
+        if export_path.exists():
+            return export_path
+
+        await self.export_snapshot(export_path)
+        previous = sorted(
+            (path for path in export_dir.glob(f"{stem}-*{suffix}") if path != export_path),
+            key=lambda path: path.stat().st_mtime,
+        )
+        for stale in previous[:-1]:
+            stale.unlink(missing_ok=True)
         return export_path
 
-    async def _get_stock_by_row(self, row_number: int) -> VehicleStock | None:
-        stmt = select(VehicleStock).where(VehicleStock.excel_row_number == row_number)
-        result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+    async def export_shards(self) -> ShardIndex:
+        """Regenerate the sharded layout from the database: one workbook per branch code plus the index.
+
+        Each branch keeps the row block it had in the previous index (new branches get
+        the next free one) and its rows are renumbered from sheet row 2 in their current
+        order. Branches stream in one after another and their workbooks are written
+        concurrently on a process pool of ``EXCEL_SHARD_WORKERS``; the shards, the
+        index and the new row numbers only replace the old ones once all are written.
+        """
+        if self.shard_dir is None:
+            raise RuntimeError("EXCEL_SHARD_DIR is not configured")
+        await drain_excel_writers()
+
+        previous = ShardIndex.load(self.shard_dir)
+        old_shards = previous.shards if previous is not None else []
+        index = ShardIndex(self.shard_dir)
+        # Existing file names stay reserved for their branches; new branches get fresh ones.
+        taken = {shard.filename.lower() for shard in old_shards}
+        next_row_base = max((shard.row_base for shard in old_shards), default=0) + SHARD_ROW_SPAN
+        row_ids: dict[int, list[int]] = {}
+        staged: list[tuple[Path, Path]] = []
+
+        loop = asyncio.get_running_loop()
+        workers = max(settings.EXCEL_SHARD_WORKERS or os.cpu_count() or 1, 1)
+        # spawn avoids forking a process that runs an event loop and DB connections.
+        executor = (
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            if workers > 1
+            else None
+        )
+        writes: deque[asyncio.Future] = deque()
+
+        async def write_shard(branch_code: str | None, rows: list[tuple]) -> None:
+            nonlocal next_row_base
+            kept = previous.shard_for_branch(branch_code) if previous is not None else None
+            if kept is not None:
+                shard = Shard(branch_code, kept.filename, kept.row_base, len(rows))
+            else:
+                shard = Shard(branch_code, shard_filename(branch_code, taken), next_row_base, len(rows))
+                taken.add(shard.filename.lower())
+                next_row_base += SHARD_ROW_SPAN
+            index.shards.append(shard)
+            row_ids[shard.row_base] = [row[-1] for row in rows]
+
+            target = index.workbook_path(shard)
+            temp_path = target.with_name(f".{target.name}.new")
+            staged.append((temp_path, target))
+            if executor is None:
+                await run_in_workbook_worker(_write_shard, str(temp_path), rows)
+                return
+            while len(writes) >= workers * 2:
+                await writes.popleft()
+            writes.append(loop.run_in_executor(executor, _write_shard, str(temp_path), rows))
+
+        stmt = (
+            select(
+                VehicleStock.branch_code,
+                VehicleStock.branch_name,
+                VehicleStock.city,
+                VehicleStock.latitude,
+                VehicleStock.longitude,
+                VehicleStock.model_code,
+                VehicleStock.model_name,
+                VehicleStock.variant,
+                VehicleStock.color,
+                VehicleStock.quantity,
+                VehicleStock.reserved,
+                VehicleStock.id,
+            )
+            .where(VehicleStock.excel_row_number.is_not(None))
+            .order_by(VehicleStock.branch_code, VehicleStock.excel_row_number)
+            .execution_options(yield_per=max(settings.IMPORT_CHUNK_SIZE, 1))
+        )
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            try:
+                branch_code: str | None = None
+                rows: list[tuple] = []
+                result = await self.session.stream(stmt)
+                async for partition in result.partitions():
+                    for row in partition:
+                        if rows and row.branch_code != branch_code:
+                            await write_shard(branch_code, rows)
+                            rows = []
+                        branch_code = row.branch_code
+                        rows.append(tuple(row))
+                if rows:
+                    await write_shard(branch_code, rows)
+            finally:
+                # Writes already handed out must finish before their files can be cleaned up.
+                await asyncio.gather(*writes, return_exceptions=True)
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+            for write in writes:
+                write.result()
+
+            await self._renumber_rows(row_ids)
+        except BaseException:
+            for temp_path, _ in staged:
+                temp_path.unlink(missing_ok=True)
+            raise
+
+        for temp_path, target in staged:
+            os.replace(temp_path, target)
+        index.save()
+        current = {shard.filename for shard in index.shards}
+        for shard in old_shards:
+            if shard.filename not in current:
+                index.workbook_path(shard).unlink(missing_ok=True)
+        await self.session.commit()
+        forget_row_indexes()
+
+        logger.info("Wrote %d Excel shards to %s", len(index.shards), self.shard_dir)
+        return index
+
+    async def _renumber_rows(self, row_ids: dict[int, list[int]]) -> None:
+        """Give each shard's stock rows the row numbers ``row base + 2, 3, ...`` in list order."""
+        # Negating first keeps the unique row numbers from colliding while they move.
+        await self.session.execute(
+            update(VehicleStock)
+            .where(VehicleStock.excel_row_number.is_not(None))
+            .values(excel_row_number=-VehicleStock.excel_row_number)
+            .execution_options(synchronize_session=False)
+        )
+        for row_base, ids in row_ids.items():
+            if ids:
+                await self.session.execute(
+                    update(VehicleStock),
+                    [
+                        {"id": stock_id, "excel_row_number": row_base + sheet_row}
+                        for sheet_row, stock_id in enumerate(ids, start=2)
+                    ],
+                )
+
+    async def _delete_stale_rows(self, seen_rows: set[int]) -> int:
+        """Delete row-numbered stock missing from ``seen_rows`` with an anti-join.
+
+        The row numbers go into a temporary table on the session's connection and
+        transaction (COPY on PostgreSQL), so the statement size no longer grows
+        with the sheet.
+        """
+        await self.session.execute(DropTable(seen_rows_table, if_exists=True))
+        await self.session.execute(CreateTable(seen_rows_table))
+        try:
+            if self.session.get_bind().dialect.name == "postgresql":
+                connection = await self.session.connection()
+                raw_connection = await connection.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(
+                    seen_rows_table.name, records=[(row_no,) for row_no in seen_rows], columns=["row_no"]
+                )
+            else:
+                await self.session.execute(insert(seen_rows_table), [{"row_no": row_no} for row_no in seen_rows])
+
+            stmt = delete(VehicleStock).where(
+                VehicleStock.excel_row_number.is_not(None),
+                ~exists().where(seen_rows_table.c.row_no == VehicleStock.excel_row_number),
+            )
+            result = await self.session.execute(stmt)
+            return result.rowcount or 0
+        finally:
+            await self.session.execute(DropTable(seen_rows_table, if_exists=True))
+
+    async def _rows_in_sync(self, row_count: int) -> bool:
+        """Whether all ``row_count`` synced rows still exist and none was edited outside the sync."""
+        stmt = select(func.count(), func.count(VehicleStock.excel_row_digest)).where(
+            VehicleStock.excel_row_number.is_not(None)
+        )
+        rows, digests = (await self.session.execute(stmt)).one()
+        return rows == digests == row_count
+
+    def _apply_row(
+        self,
+        excel_row_number: int,
+        digest: str,
+        payload: dict,
+        synced: dict[int, tuple[int, str | None]],
+        stocks: dict[int, VehicleStock],
+        branches: dict[str, Branch],
+        summary: ImportSummary,
+    ) -> None:
+        known = synced.get(excel_row_number)
+        # Branches follow every row (the last one for a code wins), changed or not.
+        branch = self._ensure_branch(payload, branches)
+
+        if known is not None and known[1] == digest:
+            summary.unchanged += 1
+            return
+        payload["excel_row_digest"] = digest
+
+        if known is None:
+            stock = VehicleStock(**payload)
+            self.session.add(stock)
+            summary.created += 1
+        else:
+            stock = stocks[known[0]]
+            for field, value in payload.items():
+                setattr(stock, field, value)
+            summary.updated += 1
+
+        if branch:
+            stock.branch_code = branch.code
+            stock.branch_name = branch.name
+            stock.city = branch.city
+            stock.latitude = branch.latitude
+            stock.longitude = branch.longitude
+
+    def _row_batches(self, sources: list[tuple[Path, int]]) -> AsyncIterator[list[tuple[int, str, dict]]]:
+        workers = min(len(sources), settings.EXCEL_SHARD_WORKERS or os.cpu_count() or 1)
+        if workers > 1:
+            return self._read_shard_batches(sources, workers)
+        return self._read_row_batches(sources)
+
+    async def _read_shard_batches(
+        self, sources: list[tuple[Path, int]], workers: int
+    ) -> AsyncIterator[list[tuple[int, str, dict]]]:
+        """Parse shard workbooks concurrently on a process pool, yielding their rows in index order.
+
+        At most ``2 * workers`` shards are parsed or waiting at a time, so memory is
+        bounded by the size of the shards rather than of the whole inventory.
+        """
+        loop = asyncio.get_running_loop()
+        batch_size = max(settings.EXCEL_SYNC_BATCH_SIZE, 1)
+        remaining = iter(sources)
+        pending: deque[asyncio.Future] = deque()
+        # spawn avoids forking a process that runs an event loop and DB connections.
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+        def submit_next() -> None:
+            source = next(remaining, None)
+            if source is not None:
+                pending.append(loop.run_in_executor(executor, _parse_shard, str(source[0]), source[1]))
+
+        try:
+            for _ in range(workers * 2):
+                submit_next()
+            while pending:
+                rows = await pending.popleft()
+                submit_next()
+                for start in range(0, len(rows), batch_size):
+                    yield rows[start:start + batch_size]
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _read_row_batches(self, sources: list[tuple[Path, int]]) -> AsyncIterator[list[tuple[int, str, dict]]]:
+        """Rows of the active sheet of each source as ``(row number, digest, payload)`` batches.
+
+        The workbooks are opened read-only on the workbook worker, which parses rows
+        into payloads and hands them over in ``EXCEL_SYNC_BATCH_SIZE`` batches through
+        a queue of ``EXCEL_SYNC_QUEUE_DEPTH``, so it stays a bounded distance ahead.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(settings.EXCEL_SYNC_QUEUE_DEPTH, 1))
+        stopped = threading.Event()
+
+        def put(item: Any) -> None:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    return future.result(timeout=0.1)
+                except TimeoutError:
+                    if stopped.is_set():
+                        future.cancel()
+                        raise _StopReading from None
+
+        producer = loop.run_in_executor(_workbook_executor, self._produce_row_batches, put, sources)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            await producer
+
+    def _produce_row_batches(self, put: Callable[[Any], None], sources: list[tuple[Path, int]]) -> None:
+        batch_size = max(settings.EXCEL_SYNC_BATCH_SIZE, 1)
+        try:
+            batch = []
+            for path, row_base in sources:
+                for parsed in self._iter_workbook_rows(path, row_base):
+                    batch.append(parsed)
+                    if len(batch) >= batch_size:
+                        put(batch)
+                        batch = []
+            if batch:
+                put(batch)
+            put(None)
+        except _StopReading:
+            return
+        except Exception as exc:
+            try:
+                put(exc)
+            except _StopReading:
+                return
+
+    @classmethod
+    def _iter_workbook_rows(cls, path: Path, row_base: int = 0) -> Iterator[tuple[int, str, dict]]:
+        """Non-empty rows of the workbook's active sheet, numbered from ``row_base``."""
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            normalized = [cls._normalize(value) for value in next(rows, ())]
+            # Folding the header into each digest re-applies every row when the columns move.
+            header_key = "\x1e".join(normalized)
+
+            for sheet_row, row in enumerate(rows, start=2):
+                if not any(row):
+                    continue
+                excel_row_number = row_base + sheet_row
+                row_data = {normalized[idx]: row[idx] for idx in range(len(normalized)) if idx < len(row)}
+                yield excel_row_number, _row_digest(header_key, row), cls._payload_from_row(row_data, excel_row_number)
+        finally:
+            workbook.close()
+
+    async def _load_synced_rows(self) -> dict[int, tuple[int, str | None]]:
+        """``(id, digest)`` of every row-numbered stock row, by row number."""
+        stmt = (
+            select(VehicleStock.excel_row_number, VehicleStock.id, VehicleStock.excel_row_digest)
+            .where(VehicleStock.excel_row_number.is_not(None))
+            .execution_options(yield_per=max(settings.IMPORT_CHUNK_SIZE, 1))
+        )
+        synced: dict[int, tuple[int, str | None]] = {}
+        result = await self.session.stream(stmt)
+        async for partition in result.partitions():
+            synced.update((row_number, (stock_id, digest)) for row_number, stock_id, digest in partition)
+        return synced
+
+    async def _load_changed_stocks(
+        self, batch: list[tuple[int, str, dict]], synced: dict[int, tuple[int, str | None]]
+    ) -> dict[int, VehicleStock]:
+        """Stock rows, by id, of the batch's rows whose stored digest differs from the sheet."""
+        ids = [
+            known[0]
+            for excel_row_number, digest, _ in batch
+            if (known := synced.get(excel_row_number)) is not None and known[1] != digest
+        ]
+        if not ids:
+            return {}
+        result = await self.session.execute(select(VehicleStock).where(VehicleStock.id.in_(ids)))
+        return {stock.id: stock for stock in result.scalars()}
 
-    async def _ensure_branch(self, payload: dict) -> Branch | None:
+    async def _load_branches_by_code(self) -> dict[str, Branch]:
+        result = await self.session.execute(select(Branch))
+        return {branch.code: branch for branch in result.scalars()}
+
+    def _ensure_branch(self, payload: dict, branches: dict[str, Branch]) -> Branch | None:
         code = payload.get("branch_code")
         name = payload.get("branch_name")
         city = payload.get("city")
@@ -163,9 +1175,7 @@ class ExcelSyncService:
         if not code or not name or not city:
             return None
 
-        stmt = select(Branch).where(Branch.code == code)
-        result = await self.session.execute(stmt)
-        branch = result.scalar_one_or_none()
+        branch = branches.get(code)
         if branch is None:
             branch = Branch(
                 code=code,
@@ -175,64 +1185,44 @@ class ExcelSyncService:
                 longitude=payload.get("longitude"),
             )
             self.session.add(branch)
-            await self.session.flush()
+            branches[code] = branch
         else:
-            updated = False
             if payload.get("latitude") is not None and branch.latitude != payload["latitude"]:
                 branch.latitude = payload["latitude"]
-                updated = True
             if payload.get("longitude") is not None and branch.longitude != payload["longitude"]:
                 branch.longitude = payload["longitude"]
-                updated = True
             if name and branch.name != name:
                 branch.name = name
-                updated = True
             if city and branch.city != city:
                 branch.city = city
-                updated = True
-            if updated:
-                await self.session.flush()
         return branch
 
-    def _payload_from_row(self, row: dict, excel_row_number: int) -> dict:
+    @classmethod
+    def _payload_from_row(cls, row: dict, excel_row_number: int) -> dict:
         return {
             "excel_row_number": excel_row_number,
-            "branch_code": self._safe_str(row.get("branch_code")),
-            "branch_name": self._safe_str(row.get("branch_name")),
-            "city": self._safe_str(row.get("city")),
-            "latitude": self._safe_float(row.get("latitude")),
-            "longitude": self._safe_float(row.get("longitude")),
-            "model_code": self._safe_str(row.get("model_code")),
-            "model_name": self._safe_str(row.get("model_name")) or "Unknown Model",
-            "variant": self._safe_str(row.get("variant")),
-            "color": self._safe_str(row.get("color")),
-            "quantity": self._safe_int(row.get("quantity"), default=0),
-            "reserved": self._safe_int(row.get("reserved"), default=0),
+            "branch_code": cls._safe_str(row.get("branch_code")),
+            "branch_name": cls._safe_str(row.get("branch_name")),
+            "city": cls._safe_str(row.get("city")),
+            "latitude": cls._safe_float(row.get("latitude")),
+            "longitude": cls._safe_float(row.get("longitude")),
+            "model_code": cls._safe_str(row.get("model_code")),
+            "model_name": cls._safe_str(row.get("model_name")) or "Unknown Model",
+            "variant": cls._safe_str(row.get("variant")),
+            "color": cls._safe_str(row.get("color")),
+            "quantity": cls._safe_int(row.get("quantity"), default=0),
+            "reserved": cls._safe_int(row.get("reserved"), default=0),
             "last_synced_at": datetime.utcnow(),
         }
 
-    async def _load_workbook(self) -> Workbook:
-        if not self.workbook_path.exists():
+    async def _ensure_workbook(self, path: Path) -> None:
+        if not path.exists():
             workbook = Workbook()
             sheet = workbook.active
             sheet.title = "Inventory"
             sheet.append(EXCEL_HEADERS)
-            await asyncio.to_thread(workbook.save, self.workbook_path)
-            await asyncio.to_thread(workbook.close)
-        return await asyncio.to_thread(load_workbook, self.workbook_path)
-
-    @staticmethod
-    def _autosize_columns(worksheet) -> None:
-        for idx, column in enumerate(worksheet.columns, start=1):
-            max_length = 0
-            column_letter = get_column_letter(idx)
-            for cell in column:
-                try:
-                    value = str(cell.value) if cell.value is not None else ""
-                    max_length = max(max_length, len(value))
-                except Exception:
-                    continue
-            worksheet.column_dimensions[column_letter].width = max(max_length + 2, 12)
+            await run_in_workbook_worker(workbook.save, path)
+            workbook.close()
 
     @staticmethod
     def _normalize(value) -> str:
@@ -265,9 +1255,3 @@ class ExcelSyncService:
             return int(float(value))
         except (TypeError, ValueError):
             return default
-
-    @staticmethod
-    def _round_float(value) -> float | None:
-        if value is None:
-            return None
-        return round(float(value), 6)
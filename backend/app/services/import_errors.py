@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import bisect
+import csv
+import os
+from pathlib import Path
+from typing import Any, TextIO
+
+REPORT_COLUMNS = ("row", "detail")
+
+
+class ErrorReport:
+    """Row-level import errors streamed to a CSV file, with a small sample kept in memory.
+
+    ``append`` mirrors ``list.append`` so the pipeline can report errors the way it
+    always has. The sample holds the ``sample_size`` errors with the lowest row
+    numbers, whatever order they arrive in. Without a path only the count and the
+    sample are kept.
+    """
+
+    def __init__(self, path: Path | None = None, sample_size: int = 50) -> None:
+        self.path = path
+        self.sample_size = sample_size
+        self.count = 0
+        self.sample: list[dict[str, Any]] = []
+        self._handle: TextIO | None = None
+        self._writer: Any = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def open(self, offset: int = 0, count: int = 0, sample: list[dict[str, Any]] | None = None) -> None:
+        """Start writing, continuing a report that was checkpointed at ``offset`` bytes.
+
+        Anything written after the checkpoint belongs to rows that will be processed
+        again, so it is truncated away.
+        """
+        self.count = count
+        self.sample = list(sample or [])
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if offset and self.path.exists():
+            os.truncate(self.path, offset)
+            self._handle = self.path.open("a", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._handle)
+        else:
+            self._handle = self.path.open("w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._handle)
+            self._writer.writerow(REPORT_COLUMNS)
+
+    def append(self, error: dict[str, Any]) -> None:
+        self.count += 1
+        if self._writer is not None:
+            self._writer.writerow((error["row"], error["detail"]))
+        if len(self.sample) < self.sample_size:
+            bisect.insort(self.sample, error, key=_row_of)
+        elif self.sample_size and error["row"] < self.sample[-1]["row"]:
+            bisect.insort(self.sample, error, key=_row_of)
+            self.sample.pop()
+
+    def flush(self) -> int:
+        """Flush buffered rows and return the report size, usable as a resume offset."""
+        if self._handle is None:
+            return 0
+        self._handle.flush()
+        return self._handle.tell()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            self._writer = None
+
+
+def _row_of(error: dict[str, Any]) -> int:
+    return error["row"]
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from typing import Any, Callable, NamedTuple, Sequence
+
+
+class ImportRow(NamedTuple):
+    """Compact, positionally packed view of one spreadsheet row."""
+
+    branch_code: Any
+    branch_name: Any
+    city: Any
+    latitude: Any
+    longitude: Any
+    model_code: Any
+    model_name: Any
+    model: Any
+    quantity: Any
+    reserved: Any
+
+
+IMPORT_FIELDS: tuple[str, ...] = ImportRow._fields
+
+# Rows without these are rejected; every other field is optional.
+REQUIRED_FIELDS: tuple[str, ...] = ("branch_code", "model_code", "quantity")
+
+# Headers that fill the same field: the model name is read from ``model_name``, falling back to ``model``.
+FIELD_ALIASES: dict[str, str] = {"model": "model_name"}
+
+
+def normalize_header(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip().lower().replace(" ", "_").replace("-", "_")
+    return str(value).strip().lower()
+
+
+def _is_blank(value: Any) -> bool:
+    if value.__class__ is str:
+        return value.strip() == ""
+    return value is None
+
+
+class MappingProfile:
+    """Header layout of one file, resolved once into column positions.
+
+    ``compile`` returns a row extractor that reads the known fields out of a raw
+    row tuple by position, so no per-row header normalisation or dict building is
+    needed. When several columns normalise to the same name the right-most one
+    wins, as it did with dict-based rows.
+    """
+
+    def __init__(self, header: Sequence[Any]) -> None:
+        positions: dict[str, int] = {}
+        for idx, cell in enumerate(header):
+            name = normalize_header(cell)
+            if name:
+                positions[name] = idx
+
+        self.positions = positions
+        present = {FIELD_ALIASES.get(name, name) for name in positions}
+        fields = dict.fromkeys(FIELD_ALIASES.get(name, name) for name in IMPORT_FIELDS)
+        self.missing_required = tuple(name for name in REQUIRED_FIELDS if name not in present)
+        self.missing_optional = tuple(
+            name for name in fields if name not in present and name not in REQUIRED_FIELDS
+        )
+
+    def compile(self, skip_blank: bool = False) -> Callable[[Sequence[Any]], ImportRow | None]:
+        """Build the per-file row extractor.
+
+        With ``skip_blank`` rows whose named columns are all empty yield ``None``.
+        """
+        slots = tuple(self.positions.get(name) for name in IMPORT_FIELDS)
+        mapped = {idx for idx in slots if idx is not None}
+        # Columns outside the known fields only matter for deciding whether a row is blank.
+        extra = tuple(sorted(idx for idx in self.positions.values() if idx not in mapped))
+        make_row = ImportRow._make
+
+        def extract(raw: Sequence[Any]) -> ImportRow | None:
+            size = len(raw)
+            values: list[Any] = []
+            append = values.append
+            for idx in slots:
+                if idx is None or idx >= size:
+                    append(None)
+                    continue
+                value = raw[idx]
+                append(value.strip() if value.__class__ is str else value)
+            if (
+                skip_blank
+                and all(value is None or value == "" for value in values)
+                and all(_is_blank(raw[idx]) for idx in extra if idx < size)
+            ):
+                return None
+            return make_row(values)
+
+        return extract
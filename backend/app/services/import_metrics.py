@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds (exclusive, in bytes) of the file size buckets used when aggregating jobs.
+SIZE_BUCKETS: tuple[tuple[str, int | None], ...] = (
+    ("<1MB", 1024 * 1024),
+    ("1-10MB", 10 * 1024 * 1024),
+    ("10-100MB", 100 * 1024 * 1024),
+    (">=100MB", None),
+)
+
+
+@dataclass
+class _StageTotals:
+    seconds: float = 0.0
+    rows: int = 0
+    round_trips: int = 0
+
+
+class PipelineMetrics:
+    """Wall time, row counts and DB round trips per import pipeline stage.
+
+    Round trips are counted from the engine's cursor executions and commits while
+    ``track`` is active, so batched statements count once per batch actually sent.
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, _StageTotals] = {}
+        self.round_trips = 0
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def track(self, engine: Engine) -> Iterator[None]:
+        def count(*_: Any) -> None:
+            self.round_trips += 1
+
+        event.listen(engine, "before_cursor_execute", count)
+        event.listen(engine, "commit", count)
+        try:
+            yield
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+            event.remove(engine, "commit", count)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0) -> Iterator[_StageTotals]:
+        """Time the block under ``name``; rows only known afterwards can be added to the yielded totals."""
+        totals = self.stages.setdefault(name, _StageTotals())
+        round_trips = self.round_trips
+        started = time.perf_counter()
+        try:
+            yield totals
+        finally:
+            totals.seconds += time.perf_counter() - started
+            totals.rows += rows
+            totals.round_trips += self.round_trips - round_trips
+
+    def as_summary(self, rows: int) -> dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        return {
+            "total_seconds": round(elapsed, 4),
+            "rows_per_second": _rate(rows, elapsed),
+            "round_trips": self.round_trips,
+            "stages": {
+                name: {
+                    "seconds": round(totals.seconds, 4),
+                    "rows": totals.rows,
+                    "rows_per_second": _rate(totals.rows, totals.seconds),
+                    "round_trips": totals.round_trips,
+                }
+                for name, totals in self.stages.items()
+            },
+        }
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes a sleeping task while the block runs.
+
+    Every ``interval`` seconds a task records how far past its deadline it was
+    resumed; long stretches of synchronous work on the loop show up as lag.
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> LoopLagMonitor:
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def max_ms(self) -> float:
+        return round(max(self.samples, default=0.0) * 1000, 1)
+
+    def as_summary(self) -> dict[str, Any]:
+        ordered = sorted(self.samples)
+        p95 = _nearest_rank(ordered, 0.95)
+        return {
+            "samples": len(ordered),
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "max_ms": self.max_ms,
+        }
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - deadline, 0.0))
+
+
+def size_bucket(size: int) -> str:
+    for label, upper in SIZE_BUCKETS:
+        if upper is None or size < upper:
+            return label
+    return SIZE_BUCKETS[-1][0]
+
+
+def aggregate_job_metrics(summaries: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """p50/p95 of total and per-stage timings, grouped by upload size bucket.
+
+    Only summaries that carry both ``file_size`` and ``metrics`` are considered.
+    """
+    grouped: dict[str, list[dict[str, Any]]] = {}
+    for summary in summaries:
+        metrics = summary.get("metrics")
+        size = summary.get("file_size")
+        if not metrics or size is None:
+            continue
+        grouped.setdefault(size_bucket(size), []).append(metrics)
+
+    buckets = []
+    for label, _ in SIZE_BUCKETS:
+        samples = grouped.get(label)
+        if not samples:
+            continue
+        stage_names = sorted({name for sample in samples for name in sample.get("stages", {})})
+        buckets.append({
+            "size_bucket": label,
+            "jobs": len(samples),
+            "total_seconds": _percentiles(sample["total_seconds"] for sample in samples),
+            "rows_per_second": _percentiles(sample["rows_per_second"] for sample in samples),
+            "round_trips": _percentiles(sample["round_trips"] for sample in samples),
+            "stages": {
+                name: {
+                    "seconds": _percentiles(
+                        sample["stages"][name]["seconds"] for sample in samples if name in sample["stages"]
+                    ),
+                    "rows_per_second": _percentiles(
+                        sample["stages"][name]["rows_per_second"] for sample in samples if name in sample["stages"]
+                    ),
+                }
+                for name in stage_names
+            },
+        })
+    return buckets
+
+
+def _rate(rows: int, seconds: float) -> float | None:
+    if not rows or seconds <= 0:
+        return None
+    return round(rows / seconds, 1)
+
+
+def _percentiles(values: Iterable[float | int | None]) -> dict[str, float | None]:
+    ordered = sorted(value for value in values if value is not None)
+    return {"p50": _nearest_rank(ordered, 0.50), "p95": _nearest_rank(ordered, 0.95)}
+
+
+def _nearest_rank(ordered: list[float | int], quantile: float) -> float | None:
+    if not ordered:
+        return None
+    rank = max(math.ceil(quantile * len(ordered)), 1)
+    return ordered[rank - 1]
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    case,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateIndex, CreateTable, DropTable
+
+from app.models.branch import Branch
+from app.models.import_log import ImportRowDigest
+from app.models.inventory import Inventory
+from app.models.vehicle_model import VehicleModel
+from app.services.import_errors import ErrorReport
+
+# Kept off the application metadata so ``create_all`` and Alembic never see it.
+_staging_metadata = MetaData()
+
+staging_rows = Table(
+    "import_staging_rows",
+    _staging_metadata,
+    Column("row_no", Integer, primary_key=True, autoincrement=False),
+    Column("branch_code", String, nullable=False),
+    Column("branch_name", String),
+    Column("city", String),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("model_code", String, nullable=False),
+    Column("model_name", String, nullable=False),
+    Column("model_key", String, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("reserved", Integer, nullable=False),
+    Column("digest", String, nullable=False),
+    Column("branch_id", Integer),
+    Column("model_id", Integer),
+    Index("ix_import_staging_rows_branch_code", "branch_code"),
+    Index("ix_import_staging_rows_model_code", "model_code"),
+    Index("ix_import_staging_rows_model_key", "model_key"),
+    Index("ix_import_staging_rows_branch_model", "branch_id", "model_id"),
+    # Temporary tables are private to the connection and, on PostgreSQL, unlogged.
+    prefixes=["TEMPORARY"],
+)
+
+# Columns filled from parsed rows; branch_id/model_id are resolved by the merge.
+STAGING_COLUMNS: tuple[str, ...] = (
+    "row_no",
+    "branch_code",
+    "branch_name",
+    "city",
+    "latitude",
+    "longitude",
+    "model_code",
+    "model_name",
+    "model_key",
+    "quantity",
+    "reserved",
+    "digest",
+)
+
+
+@dataclass
+class MergeResult:
+    branches_created: int = 0
+    branches_updated: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+
+class StagingMerge:
+    """Bulk-load validated import rows into a staging table and merge them set-wise.
+
+    On PostgreSQL rows are loaded with asyncpg's ``copy_records_to_table``; other
+    dialects (SQLite in tests) fall back to an executemany INSERT. Everything runs
+    on the session's current connection and transaction, so the caller commits or
+    rolls back the whole import at once.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+        self.dialect = session.get_bind().dialect.name
+
+    async def create(self) -> None:
+        await self.session.execute(DropTable(staging_rows, if_exists=True))
+        await self.session.execute(CreateTable(staging_rows))
+        for index in staging_rows.indexes:
+            await self.session.execute(CreateIndex(index))
+
+    async def drop(self) -> None:
+        await self.session.execute(DropTable(staging_rows, if_exists=True))
+
+    async def load(self, records: Sequence[tuple[Any, ...]]) -> None:
+        """Append records laid out as ``STAGING_COLUMNS``."""
+        if not records:
+            return
+        if self.dialect == "postgresql":
+            connection = await self.session.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                staging_rows.name, records=records, columns=STAGING_COLUMNS
+            )
+            return
+        await self.session.execute(
+            insert(staging_rows), [dict(zip(STAGING_COLUMNS, record)) for record in records]
+        )
+
+    async def merge(self, errors: ErrorReport) -> MergeResult:
+        """Resolve branches and models, then merge quantities and row digests.
+
+        Rows that cannot be applied are reported to ``errors``.
+
+        Branches are created from the first staged row that names them and take
+        the latest non-empty details of later rows; models are matched by code,
+        then by case-insensitive name, and created otherwise. When several rows
+        target the same inventory row the last one wins, and rows whose values
+        are already current are not rewritten.
+        """
+        result = MergeResult()
+        result.branches_created = await self._create_branches()
+        result.branches_updated = await self._update_branches()
+        await self._report_missing_coordinates(errors)
+        await self._resolve_branch_ids()
+        await self._report_unknown_branches(errors)
+        await self._resolve_models()
+        await self._report_unresolved_models(errors)
+        result.created, result.updated, result.unchanged = await self._merge_inventory()
+        await self._merge_digests()
+        return result
+
+    def _insert(self, table: Table) -> Any:
+        insert_factory = sqlite_insert if self.dialect == "sqlite" else pg_insert
+        return insert_factory(table)
+
+    async def _create_branches(self) -> int:
+        branches = Branch.__table__
+        s = staging_rows
+        s2 = staging_rows.alias("s2")
+        first_named_row = (
+            select(func.min(s2.c.row_no))
+            .where(s2.c.branch_code == s.c.branch_code, s2.c.branch_name.is_not(None), s2.c.city.is_not(None))
+            .scalar_subquery()
+        )
+        rows = select(s.c.branch_code, s.c.branch_name, s.c.city, s.c.latitude, s.c.longitude).where(
+            s.c.row_no == first_named_row,
+            ~exists().where(branches.c.code == s.c.branch_code),
+        )
+        stmt = (
+            self._insert(branches)
+            .from_select(["code", "name", "city", "latitude", "longitude"], rows)
+            .on_conflict_do_nothing()
+            .returning(branches.c.id)
+        )
+        created = await self.session.execute(stmt)
+        return len(created.all())
+
+    async def _update_branches(self) -> int:
+        branches = Branch.__table__
+        s2 = staging_rows.alias("s2")
+
+        def latest(name: str) -> Any:
+            value = s2.c[name]
+            return (
+                select(value)
+                .where(s2.c.branch_code == branches.c.code, value.is_not(None))
+                .order_by(s2.c.row_no.desc())
+                .limit(1)
+                .scalar_subquery()
+            )
+
+        values = {
+            "latitude": func.coalesce(latest("latitude"), branches.c.latitude),
+            "longitude": func.coalesce(latest("longitude"), branches.c.longitude),
+            "name": func.coalesce(latest("branch_name"), branches.c.name),
+            "city": func.coalesce(latest("city"), branches.c.city),
+        }
+        stmt = (
+            update(branches)
+            .where(
+                branches.c.code.in_(select(staging_rows.c.branch_code)),
+                or_(*(value.is_distinct_from(branches.c[name]) for name, value in values.items())),
+            )
+            .values(**values, updated_at=func.now())
+            .returning(branches.c.id)
+        )
+        updated = await self.session.execute(stmt)
+        return len(updated.all())
+
+    async def _report_missing_coordinates(self, errors: ErrorReport) -> None:
+        branches = Branch.__table__
+        s = staging_rows
+        stmt = (
+            select(func.min(s.c.row_no).label("row_no"), s.c.branch_code)
+            .join(branches, branches.c.code == s.c.branch_code)
+            .where(or_(branches.c.latitude.is_(None), branches.c.longitude.is_(None)))
+            .group_by(s.c.branch_code)
+            .order_by("row_no")
+        )
+        async for row_no, branch_code in await self.session.stream(stmt):
+            errors.append({
+                "row": row_no,
+                "detail": (
+                    f"Branch '{branch_code}' is missing latitude/longitude. Nearest showroom calculations require coordinates."
+                ),
+            })
+
+    async def _resolve_branch_ids(self) -> None:
+        branches = Branch.__table__
+        s = staging_rows
+        await self.session.execute(
+            update(s).values(branch_id=select(branches.c.id).where(branches.c.code == s.c.branch_code).scalar_subquery())
+        )
+
+    async def _report_unknown_branches(self, errors: ErrorReport) -> None:
+        s = staging_rows
+        stmt = select(s.c.row_no, s.c.branch_code).where(s.c.branch_id.is_(None)).order_by(s.c.row_no)
+        async for row_no, branch_code in await self.session.stream(stmt):
+            errors.append({
+                "row": row_no,
+                "detail": (
+                    f"Unknown branch code '{branch_code}'. Provide branch_name and city (plus latitude/longitude for nearest calculation)."
+                ),
+            })
+
+    async def _resolve_models(self) -> None:
+        models = VehicleModel.__table__
+        s = staging_rows
+        s2 = staging_rows.alias("s2")
+        model_key = func.lower(func.trim(models.c.name))
+        by_code = select(models.c.id).where(models.c.external_code == s.c.model_code).scalar_subquery()
+        by_name = select(models.c.id).where(model_key == s.c.model_key).limit(1).scalar_subquery()
+        unresolved = and_(s.c.branch_id.is_not(None), s.c.model_id.is_(None))
+
+        await self.session.execute(update(s).where(s.c.branch_id.is_not(None)).values(model_id=by_code))
+
+        # Existing models without an external code adopt the first unseen code that names them.
+        adopted_code = (
+            select(s.c.model_code)
+            .where(unresolved, s.c.model_key == model_key)
+            .order_by(s.c.row_no)
+            .limit(1)
+            .scalar_subquery()
+        )
+        await self.session.execute(
+            update(models)
+            .where(models.c.external_code.is_(None), exists().where(unresolved, s.c.model_key == model_key))
+            .values(external_code=adopted_code, updated_at=func.now())
+        )
+        await self.session.execute(update(s).where(unresolved).values(model_id=func.coalesce(by_code, by_name)))
+
+        first_row = (
+            select(func.min(s2.c.row_no))
+            .where(s2.c.model_key == s.c.model_key, s2.c.branch_id.is_not(None), s2.c.model_id.is_(None))
+            .scalar_subquery()
+        )
+        await self.session.execute(
+            self._insert(models)
+            .from_select(
+                ["name", "external_code"],
+                select(s.c.model_name, s.c.model_code).where(unresolved, s.c.row_no == first_row),
+            )
+            .on_conflict_do_nothing()
+        )
+        await self.session.execute(update(s).where(unresolved).values(model_id=func.coalesce(by_code, by_name)))
+
+    async def _report_unresolved_models(self, errors: ErrorReport) -> None:
+        s = staging_rows
+        stmt = (
+            select(s.c.row_no, s.c.model_code)
+            .where(s.c.branch_id.is_not(None), s.c.model_id.is_(None))
+            .order_by(s.c.row_no)
+        )
+        async for row_no, model_code in await self.session.stream(stmt):
+            errors.append({"row": row_no, "detail": f"Could not resolve vehicle model '{model_code}'"})
+
+    async def _merge_inventory(self) -> tuple[int, int, int]:
+        inventories = Inventory.__table__
+        s = staging_rows
+        s2 = staging_rows.alias("s2")
+        last_row = (
+            select(func.max(s2.c.row_no))
+            .where(s2.c.branch_id == s.c.branch_id, s2.c.model_id == s.c.model_id)
+            .scalar_subquery()
+        )
+        incoming = select(s.c.branch_id, s.c.model_id, s.c.quantity, s.c.reserved).where(
+            s.c.branch_id.is_not(None), s.c.model_id.is_not(None), s.c.row_no == last_row
+        )
+
+        pending = incoming.subquery()
+        existing = inventories.alias("existing")
+        changed = or_(existing.c.quantity != pending.c.quantity, existing.c.reserved != pending.c.reserved)
+        counts = await self.session.execute(
+            select(
+                func.coalesce(func.sum(case((existing.c.id.is_(None), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((and_(existing.c.id.is_not(None), changed), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((and_(existing.c.id.is_not(None), ~changed), 1), else_=0)), 0),
+            ).select_from(
+                pending.outerjoin(
+                    existing,
+                    and_(existing.c.branch_id == pending.c.branch_id, existing.c.model_id == pending.c.model_id),
+                )
+            )
+        )
+        created, updated, unchanged = counts.one()
+
+        stmt = self._insert(inventories).from_select(["branch_id", "model_id", "quantity", "reserved"], incoming)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[inventories.c.branch_id, inventories.c.model_id],
+            set_={
+                "quantity": stmt.excluded.quantity,
+                "reserved": stmt.excluded.reserved,
+                "updated_at": func.now(),
+            },
+            where=or_(
+                inventories.c.quantity != stmt.excluded.quantity,
+                inventories.c.reserved != stmt.excluded.reserved,
+            ),
+        )
+        await self.session.execute(stmt)
+        return int(created), int(updated), int(unchanged)
+
+    async def _merge_digests(self) -> None:
+        digests = ImportRowDigest.__table__
+        s = staging_rows
+        s2 = staging_rows.alias("s2")
+        last_row = (
+            select(func.max(s2.c.row_no))
+            .where(
+                s2.c.branch_code == s.c.branch_code,
+                s2.c.model_code == s.c.model_code,
+                s2.c.model_id.is_not(None),
+            )
+            .scalar_subquery()
+        )
+        rows = select(s.c.branch_code, s.c.model_code, s.c.digest).where(
+            s.c.model_id.is_not(None), s.c.row_no == last_row
+        )
+        stmt = self._insert(digests).from_select(["branch_code", "model_code", "digest"], rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[digests.c.branch_code, digests.c.model_code],
+            set_={"digest": stmt.excluded.digest, "cleared_at": None, "updated_at": func.now()},
+        )
+        await self.session.execute(stmt)
@@ -1,289 +1,1073 @@
 from __future__ import annotations
 
+import asyncio
 import csv
-from datetime import datetime, timezone
-from io import BytesIO
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from itertools import islice
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, BinaryIO, Iterator, Protocol
+from zipfile import BadZipFile
 
+import billiard
 from openpyxl import load_workbook
-from sqlalchemy import select
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import exists, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
+from app.db.base import Base
 from app.models.branch import Branch
-from app.models.import_log import ImportJob
+from app.models.import_log import ImportJob, ImportRowDigest
 from app.models.inventory import Inventory
 from app.models.vehicle_model import VehicleModel
 from app.schemas.import_job import ImportJobCreate
+from app.services.import_errors import ErrorReport
+from app.services.import_mapping import IMPORT_FIELDS, ImportRow, MappingProfile
+from app.services.import_metrics import PipelineMetrics, aggregate_job_metrics
+from app.services.import_staging import StagingMerge
+
+
+RowChunk = list[tuple[int, ImportRow]]
+InventoryKey = tuple[int, int]
+RowKey = tuple[str, str]
+
+# Rows per multi-row INSERT statement; keeps bind parameters well under driver limits.
+UPSERT_BATCH_SIZE = 1000
+UPLOAD_READ_SIZE = 1024 * 1024
+
+IMPORT_STORAGE_DIR = Path("storage") / "imports"
+# Uploads are stored once per distinct content as blobs/<sha[:2]>/<sha><suffix>.
+IMPORT_BLOB_DIR = IMPORT_STORAGE_DIR / "blobs"
+# Full row-level error reports, one CSV per job.
+IMPORT_REPORT_DIR = IMPORT_STORAGE_DIR / "reports"
+# Partial uploads older than this are assumed abandoned by a crashed request.
+STALE_PARTIAL_SECONDS = 24 * 60 * 60
+
+
+class UploadSource(Protocol):
+    async def read(self, size: int = -1) -> bytes: ...
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds ``IMPORT_MAX_UPLOAD_BYTES``."""
+
+
+@dataclass
+class _ImportState:
+    """Lookup maps and running counters carried across import chunks."""
+
+    branch_map: dict[str, Branch]
+    model_code_map: dict[str, VehicleModel]
+    model_name_map: dict[str, VehicleModel]
+    # Current (quantity, reserved) per inventory row, kept in step with staged writes.
+    inventory: dict[InventoryKey, tuple[int, int]]
+    row_digests: dict[RowKey, str]
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    branches_created: int = 0
+    branches_updated: int = 0
+    created_branch_codes: set[str] = field(default_factory=set)
+    updated_branch_codes: set[str] = field(default_factory=set)
+    missing_coordinates: set[str] = field(default_factory=set)
+    errors: ErrorReport = field(default_factory=ErrorReport)
+
+    def as_summary(self) -> dict[str, Any]:
+        return {
+            "processed_rows": self.processed,
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "branches_created": self.branches_created,
+            "branches_updated": self.branches_updated,
+            "error_count": self.errors.count,
+            "errors": self.errors.sample,
+        }
+
+    def checkpoint(self) -> dict[str, Any]:
+        """Serialisable counters so an interrupted job can resume with the same totals."""
+        return {
+            **self.as_summary(),
+            "created_branch_codes": sorted(self.created_branch_codes),
+            "updated_branch_codes": sorted(self.updated_branch_codes),
+            "missing_coordinates": sorted(self.missing_coordinates),
+            "error_offset": self.errors.flush(),
+        }
+
+    def restore(self, checkpoint: dict[str, Any]) -> None:
+        self.processed = checkpoint.get("processed_rows", 0)
+        self.created = checkpoint.get("created", 0)
+        self.updated = checkpoint.get("updated", 0)
+        self.unchanged = checkpoint.get("unchanged", 0)
+        self.skipped = checkpoint.get("skipped", 0)
+        self.branches_created = checkpoint.get("branches_created", 0)
+        self.branches_updated = checkpoint.get("branches_updated", 0)
+        self.created_branch_codes = set(checkpoint.get("created_branch_codes", []))
+        self.updated_branch_codes = set(checkpoint.get("updated_branch_codes", []))
+        self.missing_coordinates = set(checkpoint.get("missing_coordinates", []))
+        self.errors.open(
+            offset=checkpoint.get("error_offset", 0),
+            count=checkpoint.get("error_count", 0),
+            sample=checkpoint.get("errors", []),
+        )
 
 
 class ImportService:
-    def __init__(self, session: AsyncSession) -> None:
+    def __init__(self, session: AsyncSession, chunk_size: int | None = None) -> None:
         self.session = session
+        self.chunk_size = max(chunk_size or settings.IMPORT_CHUNK_SIZE, 1)
 
     async def queue_import(
         self,
         payload: ImportJobCreate,
-        file_buffer: BytesIO,
+        source: UploadSource,
         uploaded_by_id: int | None = None,
     ) -> ImportJob:
-        storage_path = self._persist_file(payload.source_filename, file_buffer)
-
-        rows = self._load_rows(storage_path, payload.sheet_name)
-        if not rows:
-            raise ValueError("Uploaded file does not contain any data rows")
-
-        summary = await self._apply_inventory_updates(rows)
-
-        job_status = "completed" if not summary["errors"] else "completed_with_issues"
-        job = ImportJob(
-            branch_id=payload.branch_id,
-            uploaded_by_id=uploaded_by_id,
-            source_filename=payload.source_filename,
-            sheet_name=payload.sheet_name,
-            status=job_status,
-            summary={
-                "stored_path": storage_path.as_posix(),
-                "processed_rows": summary["processed_rows"],
-                "total_rows": summary["processed_rows"],
-                "updated_inventory": summary["updated"],
-                "created_inventory": summary["created"],
-                "branches_created": summary["branches_created"],
-                "branches_updated": summary["branches_updated"],
-                "error_count": len(summary["errors"]),
-                "errors": summary["errors"],
-            },
-            executed_at=datetime.now(timezone.utc),
+        """Persist the upload and register a pending job for the background worker.
+
+        A file whose content hash matches an already completed import of the same
+        sheet is recorded as ``skipped`` and never reaches the worker. Selecting
+        ``sheet_names`` (or ``all_sheets``) imports several worksheets in one job.
+        """
+        suffix = self._ensure_supported(payload.source_filename)
+        if (payload.sheet_names or payload.all_sheets) and suffix == ".csv":
+            raise ValueError("Sheet selection is only supported for Excel workbooks")
+        storage_path, file_sha256, file_size = await self._persist_upload(payload.source_filename, source)
+        sheet_names = await asyncio.to_thread(
+            self._resolve_sheet_names, storage_path, payload.sheet_names, payload.all_sheets
         )
+
+        previous = await self._find_completed_import(file_sha256, payload.sheet_name, sheet_names)
+        if previous is not None:
+            job = ImportJob(
+                branch_id=payload.branch_id,
+                uploaded_by_id=uploaded_by_id,
+                source_filename=payload.source_filename,
+                sheet_name=payload.sheet_name,
+                sheet_names=sheet_names,
+                ingest_backend=payload.ingest_backend,
+                status="skipped",
+                file_sha256=file_sha256,
+                summary={
+                    "stored_path": storage_path.as_posix(),
+                    "file_size": file_size,
+                    "duplicate_of": previous.id,
+                    "processed_rows": 0,
+                },
+                executed_at=datetime.now(timezone.utc),
+            )
+        else:
+            job = ImportJob(
+                branch_id=payload.branch_id,
+                uploaded_by_id=uploaded_by_id,
+                source_filename=payload.source_filename,
+                sheet_name=payload.sheet_name,
+                sheet_names=sheet_names,
+                ingest_backend=payload.ingest_backend,
+                status="pending",
+                file_sha256=file_sha256,
+                summary={"stored_path": storage_path.as_posix(), "file_size": file_size, "processed_rows": 0},
+            )
         self.session.add(job)
         await self.session.commit()
         await self.session.refresh(job)
         return job
 
+    async def mark_enqueue_failed(self, job: ImportJob, exc: Exception) -> ImportJob:
+        """Fail a job whose task could not be published, so ``/retry`` can queue it again.
+
+        A job the worker already picked up (eager mode runs it inline) keeps its own status.
+        """
+        await self.session.refresh(job)
+        if job.status == "pending":
+            job.status = "failed"
+            job.summary = {**(job.summary or {}), "error": f"Could not queue import: {exc}"}
+            job.executed_at = datetime.now(timezone.utc)
+            await self.session.commit()
+            await self.session.refresh(job)
+        return job
+
+    async def process_job(self, job_id: int) -> ImportJob:
+        """Run a queued import, committing progress on the job after every chunk.
+
+        Jobs that failed or were interrupted resume after their ``checkpoint_row``.
+        Jobs using the ``copy`` backend apply the whole file in one transaction instead.
+        """
+        job = await self.session.get(ImportJob, job_id)
+        if job is None:
+            raise ValueError(f"Import job {job_id} does not exist")
+        if job.status in {"completed", "completed_with_issues", "skipped"}:
+            return job
+
+        job.status = "processing"
+        await self.session.commit()
+
+        stored_path = Path(job.summary["stored_path"])
+        try:
+            if job.ingest_backend == "copy":
+                summary = await self._run_staged_pipeline(stored_path, job.sheet_name, job.sheet_names, job)
+            else:
+                summary = await self._run_pipeline(stored_path, job.sheet_name, job, job.sheet_names)
+        except Exception as exc:
+            await self.session.rollback()
+            await self.session.refresh(job)
+            job.status = "failed"
+            job.summary = {**(job.summary or {}), "error": str(exc)}
+            job.executed_at = datetime.now(timezone.utc)
+            await self.session.commit()
+            if isinstance(exc, ValueError):
+                return job
+            raise
+
+        job.status = "completed" if not summary["error_count"] else "completed_with_issues"
+        job.summary = {
+            "stored_path": stored_path.as_posix(),
+            "file_size": (job.summary or {}).get("file_size"),
+            "processed_rows": summary["processed_rows"],
+            "total_rows": summary["processed_rows"],
+            "updated_inventory": summary["updated"],
+            "created_inventory": summary["created"],
+            "unchanged_inventory": summary["unchanged"],
+            "skipped_rows": summary["skipped"],
+            "branches_created": summary["branches_created"],
+            "branches_updated": summary["branches_updated"],
+            "error_count": summary["error_count"],
+            "errors": summary["errors"],
+            "error_report": summary["error_report"],
+            "metrics": summary["metrics"],
+        }
+        job.executed_at = datetime.now(timezone.utc)
+        await self.session.commit()
+        await self.session.refresh(job)
+        return job
+
+    @staticmethod
+    async def preview(
+        filename: str,
+        handle: BinaryIO,
+        sheet_name: str | None = None,
+        limit: int = 20,
+    ) -> dict[str, Any]:
+        """Header, first ``limit`` rows and detected column mapping of an upload.
+
+        Nothing is stored and only the sampled rows are read: workbooks are opened
+        read-only and their row count is estimated from the sheet dimensions, CSV
+        row counts are extrapolated from the bytes the sample took.
+        """
+        suffix = ImportService._ensure_supported(filename)
+        if suffix == ".csv":
+            preview = await asyncio.to_thread(ImportService._preview_csv, handle, limit)
+        else:
+            preview = await asyncio.to_thread(ImportService._preview_excel, handle, sheet_name, limit)
+
+        profile = MappingProfile(preview["header"])
+        known = set(IMPORT_FIELDS)
+        return {
+            "source_filename": filename,
+            **preview,
+            "mapping": {name: idx for name, idx in profile.positions.items() if name in known},
+            "missing_required_fields": list(profile.missing_required),
+            "missing_optional_fields": list(profile.missing_optional),
+            "unmapped_columns": [name for name in profile.positions if name not in known],
+        }
+
+    @staticmethod
+    def _preview_csv(handle: BinaryIO, limit: int) -> dict[str, Any]:
+        handle.seek(0, os.SEEK_END)
+        total_bytes = handle.tell()
+        handle.seek(0)
+        consumed = 0
+
+        def lines() -> Iterator[str]:
+            nonlocal consumed
+            for raw in iter(handle.readline, b""):
+                consumed += len(raw)
+                yield raw.decode("utf-8-sig")
+
+        reader = csv.reader(lines())
+        header = next(reader, [])
+        header_bytes = consumed
+        rows = [raw for raw in islice(reader, limit) if raw]
+
+        if consumed >= total_bytes or not rows:
+            estimated_rows = len(rows)
+        else:
+            per_row = (consumed - header_bytes) / len(rows)
+            estimated_rows = len(rows) + round((total_bytes - consumed) / per_row)
+        return {
+            "sheet_name": None,
+            "sheet_names": [],
+            "header": header,
+            "rows": rows,
+            "estimated_rows": estimated_rows,
+        }
+
+    @staticmethod
+    def _preview_excel(handle: BinaryIO, sheet_name: str | None, limit: int) -> dict[str, Any]:
+        try:
+            workbook = load_workbook(filename=handle, data_only=True, read_only=True)
+        except (BadZipFile, InvalidFileException) as exc:
+            raise ValueError("Uploaded file is not a readable Excel workbook") from exc
+        try:
+            worksheet = workbook[sheet_name] if sheet_name and sheet_name in workbook.sheetnames else workbook.active
+            iterator = worksheet.iter_rows(values_only=True)
+            header = list(next(iterator, ()))
+            rows = [list(raw) for raw in islice(iterator, limit)]
+            # Read-only sheets take max_row from the stored <dimension>. Workbooks written without
+            # one (some streaming writers) report None here, and openpyxl scans them when opening.
+            max_row = worksheet.max_row
+            return {
+                "sheet_name": worksheet.title,
+                "sheet_names": list(workbook.sheetnames),
+                "header": header,
+                "rows": rows,
+                "estimated_rows": max(max_row - 1, 0) if max_row else None,
+            }
+        finally:
+            workbook.close()
+
+    async def get_job(self, job_id: int) -> ImportJob | None:
+        return await self.session.get(ImportJob, job_id)
+
+    @staticmethod
+    def error_report_path(job: ImportJob) -> Path | None:
+        """Location of the job's full error report, if one was written."""
+        report = (job.summary or {}).get("error_report")
+        if not report:
+            return None
+        path = Path(report)
+        return path if path.is_file() else None
+
+    async def _find_completed_import(
+        self,
+        file_sha256: str,
+        sheet_name: str | None,
+        sheet_names: list[str] | None = None,
+    ) -> ImportJob | None:
+        stmt = (
+            select(ImportJob)
+            .where(
+                ImportJob.file_sha256 == file_sha256,
+                ImportJob.sheet_name.is_(None) if sheet_name is None else ImportJob.sheet_name == sheet_name,
+                ImportJob.status.in_(("completed", "completed_with_issues")),
+            )
+            .order_by(ImportJob.created_at.desc())
+        )
+        result = await self.session.execute(stmt)
+        # JSON columns are not comparable in SQL on every backend, so the sheet selection is matched here.
+        for job in result.scalars():
+            if (job.sheet_names or None) == (sheet_names or None):
+                # Inventory edited in the app since has to be brought back in line with the file.
+                return None if await self._row_digests_cleared_since(job) else job
+        return None
+
+    async def _row_digests_cleared_since(self, job: ImportJob) -> bool:
+        """Whether inventory edited in the app has cleared any row digest since ``job`` finished."""
+        return bool(await self.session.scalar(select(exists().where(ImportRowDigest.cleared_at > job.executed_at))))
+
     async def list_recent(self, limit: int = 25) -> list[ImportJob]:
         stmt = select(ImportJob).order_by(ImportJob.created_at.desc()).limit(limit)
         result = await self.session.execute(stmt)
         return list(result.scalars().all())
 
-    @staticmethod
-    def _persist_file(filename: str, buffer: BytesIO) -> Path:
-        base_dir = Path("storage") / "imports"
-        base_dir.mkdir(parents=True, exist_ok=True)
-
-        safe_name = filename.replace("/", "_").replace("\\", "_")
-        target_path = base_dir / safe_name
-        counter = 1
-        while target_path.exists():
-            stem = Path(safe_name).stem
-            suffix = Path(safe_name).suffix
-            target_path = base_dir / f"{stem}_{counter}{suffix}"
-            counter += 1
-
-        with target_path.open("wb") as f:
-            f.write(buffer.getvalue())
-
-        return target_path
-
-    def _load_rows(self, file_path: Path, sheet_name: str | None) -> list[dict[str, Any]]:
-        suffix = file_path.suffix.lower()
-        if suffix == ".csv":
-            return self._load_csv_rows(file_path)
+    async def performance_summary(self, limit: int = 200) -> list[dict[str, Any]]:
+        """Aggregate the recorded pipeline metrics of the most recent finished jobs by file size."""
+        stmt = (
+            select(ImportJob.summary)
+            .where(ImportJob.status.in_(("completed", "completed_with_issues")))
+            .order_by(ImportJob.created_at.desc())
+            .limit(limit)
+        )
+        result = await self.session.execute(stmt)
+        return aggregate_job_metrics(summary for summary in result.scalars().all() if summary)
 
-        if suffix in {".xlsx", ".xlsm"}:
-            return self._load_excel_rows(file_path, sheet_name)
+    async def prune_storage(self, retention_days: int | None = None, dry_run: bool = False) -> list[Path]:
+        """Delete stored blobs that no import job still needs.
 
-        raise ValueError(f"Unsupported file type '{suffix}'. Upload .csv or .xlsx files")
+        Blobs of pending, processing and failed jobs are always kept so they can run
+        or resume. With ``retention_days``, blobs only referenced by finished jobs
+        older than that are pruned too. Abandoned partial uploads are removed as well.
+        """
+        stmt = select(ImportJob.file_sha256).where(ImportJob.file_sha256.is_not(None))
+        if retention_days is not None:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+            stmt = stmt.where(
+                ImportJob.status.in_(("pending", "processing", "failed")) | (ImportJob.created_at >= cutoff)
+            )
+        result = await self.session.execute(stmt)
+        referenced = set(result.scalars().all())
 
-    def _load_csv_rows(self, file_path: Path) -> list[dict[str, Any]]:
-        rows: list[dict[str, Any]] = []
-        with file_path.open("r", encoding="utf-8-sig", newline="") as handle:
-            reader = csv.DictReader(handle)
-            if reader.fieldnames is None:
-                return rows
-            normalized_fieldnames = [self._normalize_header(name) for name in reader.fieldnames if name]
-            for raw_row in reader:
-                normalized_row = {
-                    self._normalize_header(key): value.strip() if isinstance(value, str) else value
-                    for key, value in raw_row.items()
-                }
-                rows.append({key: normalized_row.get(key) for key in normalized_fieldnames})
-        return rows
-
-    def _load_excel_rows(self, file_path: Path, sheet_name: str | None) -> list[dict[str, Any]]:
-        workbook = load_workbook(filename=file_path, data_only=True, read_only=True)
-        worksheet = workbook[sheet_name] if sheet_name and sheet_name in workbook.sheetnames else workbook.active
+        removable = [
+            blob for blob in IMPORT_BLOB_DIR.glob("*/*") if blob.is_file() and blob.stem not in referenced
+        ]
+        stale_before = time.time() - STALE_PARTIAL_SECONDS
+        removable.extend(
+            partial
+            for partial in IMPORT_STORAGE_DIR.glob(".upload-*.part")
+            if partial.stat().st_mtime < stale_before
+        )
+        if not dry_run:
+            for path in removable:
+                path.unlink(missing_ok=True)
+        return removable
 
-        iterator = worksheet.iter_rows(values_only=True)
+    async def _persist_upload(self, filename: str, source: UploadSource) -> tuple[Path, str, int]:
+        """Stream the upload into content-addressed storage, hashing it on the way.
+
+        Returns the blob path, the SHA-256 of the content and its size in bytes. The file is never held
+        in memory as a whole; oversized uploads are rejected as soon as they cross
+        ``IMPORT_MAX_UPLOAD_BYTES``. Identical content is stored only once.
+        """
+        IMPORT_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+        partial_path = IMPORT_STORAGE_DIR / f".upload-{uuid.uuid4().hex}.part"
+
+        digest = hashlib.sha256()
+        size = 0
         try:
-            header_row = next(iterator)
-        except StopIteration:
-            return []
-
-        normalized_header = [self._normalize_header(cell) for cell in header_row]
-        rows: list[dict[str, Any]] = []
-        for row in iterator:
-            row_dict = {normalized_header[idx]: row[idx] for idx in range(len(normalized_header)) if normalized_header[idx]}
-            cleaned = {
-                key: (value.strip() if isinstance(value, str) else value)
-                for key, value in row_dict.items()
-            }
-            if any(value not in (None, "") for value in cleaned.values()):
-                rows.append(cleaned)
-        workbook.close()
-        return rows
-
-    async def _apply_inventory_updates(self, rows: Iterable[dict[str, Any]]) -> dict[str, Any]:
-        branch_map = await self._load_branch_map()
-        model_code_map, model_name_map = await self._load_model_maps()
-
-        processed = 0
-        created = 0
-        updated = 0
-        branches_created = 0
-        branches_updated = 0
-        created_branch_codes: set[str] = set()
-        updated_branch_codes: set[str] = set()
-        missing_coordinates: set[str] = set()
-        errors: list[dict[str, Any]] = []
-
-        for idx, raw_row in enumerate(rows, start=1):
-            processed += 1
+            with partial_path.open("wb") as handle:
+                while chunk := await source.read(UPLOAD_READ_SIZE):
+                    size += len(chunk)
+                    if size > settings.IMPORT_MAX_UPLOAD_BYTES:
+                        raise UploadTooLargeError(
+                            f"Uploaded file exceeds the {settings.IMPORT_MAX_UPLOAD_BYTES} byte limit"
+                        )
+                    digest.update(chunk)
+                    await asyncio.to_thread(handle.write, chunk)
+            if size == 0:
+                raise ValueError("Uploaded file is empty")
+
+            file_sha256 = digest.hexdigest()
+            blob_path = self._blob_path(file_sha256, filename)
+            if blob_path.exists():
+                partial_path.unlink()
+            else:
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                partial_path.replace(blob_path)
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+
+        return blob_path, file_sha256, size
+
+    @staticmethod
+    def _report_path(job_id: int) -> Path:
+        return IMPORT_REPORT_DIR / f"job-{job_id}-errors.csv"
+
+    @staticmethod
+    def _blob_path(file_sha256: str, filename: str) -> Path:
+        # The suffix is kept because the parser dispatches on it.
+        return IMPORT_BLOB_DIR / file_sha256[:2] / f"{file_sha256}{Path(filename).suffix.lower()}"
+
+    async def _run_pipeline(
+        self,
+        file_path: Path,
+        sheet_name: str | None,
+        job: ImportJob | None = None,
+        sheet_names: list[str] | None = None,
+    ) -> dict[str, Any]:
+        """Stream the file through parse → normalize → resolve → write, one chunk at a time.
+
+        Only a single chunk is materialised at any point: the next chunk is parsed
+        (off the event loop) only after the previous one has been written and
+        committed, so peak memory stays flat regardless of file size. When a job is
+        given, its progress and a resumable checkpoint are committed together with
+        each chunk, and rows up to an existing checkpoint are skipped.
+        """
+        resume_after = job.checkpoint_row if job is not None else 0
+        metrics = PipelineMetrics()
+        report = self._error_report(job)
+        chunks = self._iter_chunks(file_path, sheet_name, sheet_names)
+        with metrics.track(self.session.get_bind()):
+            try:
+                with metrics.stage("parse") as parse:
+                    first_chunk = await asyncio.to_thread(next, chunks, None)
+                    parse.rows += len(first_chunk or ())
+                if first_chunk is None:
+                    raise ValueError("Uploaded file does not contain any data rows")
+
+                with metrics.stage("load"):
+                    branch_map = await self._load_branch_map()
+                    model_code_map, model_name_map = await self._load_model_maps()
+                    state = _ImportState(
+                        branch_map=branch_map,
+                        model_code_map=model_code_map,
+                        model_name_map=model_name_map,
+                        inventory=await self._load_inventory_snapshot(),
+                        row_digests=await self._load_row_digests(),
+                        errors=report,
+                    )
+                if resume_after and job is not None:
+                    state.restore((job.summary or {}).get("checkpoint", {}))
+                else:
+                    report.open()
+
+                chunk: RowChunk | None = first_chunk
+                while chunk is not None:
+                    if chunk[-1][0] > resume_after:
+                        rows = [item for item in chunk if item[0] > resume_after]
+                        await self._apply_inventory_updates(rows, state, metrics)
+                        if job is not None:
+                            job.checkpoint_row = chunk[-1][0]
+                            job.summary = {
+                                **(job.summary or {}),
+                                "processed_rows": state.processed,
+                                "checkpoint": state.checkpoint(),
+                            }
+                        with metrics.stage("commit", rows=len(rows)):
+                            await self.session.commit()
+                    with metrics.stage("parse") as parse:
+                        chunk = await asyncio.to_thread(next, chunks, None)
+                        parse.rows += len(chunk or ())
+            finally:
+                chunks.close()
+                report.close()
+
+        return {
+            **state.as_summary(),
+            "error_report": self._finish_report(report),
+            "metrics": metrics.as_summary(state.processed),
+        }
+
+    async def _run_staged_pipeline(
+        self,
+        file_path: Path,
+        sheet_name: str | None,
+        sheet_names: list[str] | None = None,
+        job: ImportJob | None = None,
+    ) -> dict[str, Any]:
+        """Bulk-load every valid row into a staging table, then merge it with set-based SQL.
+
+        Rows are validated and digest-checked per chunk exactly like the ORM path
+        and streamed into the staging table; branch/model resolution and the
+        inventory merge then run as a handful of statements over the whole file.
+        The import commits once at the end, so it has no chunk checkpoints.
+        """
+        metrics = PipelineMetrics()
+        staging = StagingMerge(self.session)
+        errors = self._error_report(job)
+        errors.open()
+        processed = skipped = 0
+        chunks = self._iter_chunks(file_path, sheet_name, sheet_names)
+        with metrics.track(self.session.get_bind()):
+            try:
+                with metrics.stage("load"):
+                    row_digests = await self._load_row_digests()
+                    await staging.create()
+
+                while True:
+                    with metrics.stage("parse") as parse:
+                        chunk = await asyncio.to_thread(next, chunks, None)
+                        parse.rows += len(chunk or ())
+                    if chunk is None:
+                        break
+                    processed += len(chunk)
+                    with metrics.stage("resolve", rows=len(chunk)):
+                        records, chunk_skipped = self._staging_records(chunk, row_digests, errors)
+                    skipped += chunk_skipped
+                    with metrics.stage("stage", rows=len(records)):
+                        await staging.load(records)
+                if not processed:
+                    raise ValueError("Uploaded file does not contain any data rows")
+
+                with metrics.stage("merge", rows=processed):
+                    merged = await staging.merge(errors)
+                    await staging.drop()
+            finally:
+                chunks.close()
+                errors.close()
+            with metrics.stage("commit", rows=processed):
+                await self.session.commit()
+
+        return {
+            "processed_rows": processed,
+            "created": merged.created,
+            "updated": merged.updated,
+            "unchanged": merged.unchanged,
+            "skipped": skipped,
+            "branches_created": merged.branches_created,
+            "branches_updated": merged.branches_updated,
+            "error_count": errors.count,
+            "errors": errors.sample,
+            "error_report": self._finish_report(errors),
+            "metrics": metrics.as_summary(processed),
+        }
+
+    def _staging_records(
+        self,
+        rows: RowChunk,
+        row_digests: dict[RowKey, str],
+        errors: ErrorReport,
+    ) -> tuple[list[tuple[Any, ...]], int]:
+        """Validate a chunk and lay its applicable rows out as staging records.
+
+        Returns the records and the number of rows skipped as already imported.
+        """
+        records: list[tuple[Any, ...]] = []
+        skipped = 0
+        for idx, row in rows:
             try:
-                branch_code = self._require_field(raw_row, "branch_code")
-                model_code = self._require_field(raw_row, "model_code")
+                branch_code = self._require_field(row.branch_code, "branch_code")
+                model_code = self._require_field(row.model_code, "model_code")
             except ValueError as exc:
                 errors.append({"row": idx, "detail": str(exc)})
                 continue
 
-            branch = branch_map.get(branch_code)
-            if branch is None:
-                branch_name = self._optional_field(raw_row, "branch_name")
-                branch_city = self._optional_field(raw_row, "city")
-                if branch_name and branch_city:
-                    latitude = self._optional_float(raw_row, "latitude")
-                    longitude = self._optional_float(raw_row, "longitude")
-                    
-                    # Validate coordinate ranges
+            digest = self._row_digest(row)
+            if row_digests.get((branch_code, model_code)) == digest:
+                skipped += 1
+                continue
+
+            latitude = self._optional_float(row.latitude)
+            longitude = self._optional_float(row.longitude)
+            if latitude is not None and not (-90 <= latitude <= 90):
+                errors.append({"row": idx, "detail": f"Latitude {latitude} out of range (-90 to 90)"})
+                continue
+            if longitude is not None and not (-180 <= longitude <= 180):
+                errors.append({"row": idx, "detail": f"Longitude {longitude} out of range (-180 to 180)"})
+                continue
+
+            quantity = row.quantity
+            reserved = row.reserved or 0
+            try:
+                if quantity.__class__ is not int:
+                    quantity = int(float(quantity))
+                if reserved.__class__ is not int:
+                    reserved = int(float(reserved))
+            except (TypeError, ValueError, OverflowError):
+                errors.append({"row": idx, "detail": "Quantity or reserved value is not a number"})
+                continue
+            if quantity < 0 or reserved < 0:
+                errors.append({"row": idx, "detail": "Quantity and reserved must be non-negative"})
+                continue
+
+            model_name = str(row.model_name or row.model or model_code)
+            records.append((
+                idx,
+                branch_code,
+                self._optional_field(row.branch_name),
+                self._optional_field(row.city),
+                latitude,
+                longitude,
+                model_code,
+                model_name,
+                model_name.strip().lower(),
+                quantity,
+                reserved,
+                digest,
+            ))
+        return records, skipped
+
+    def _error_report(self, job: ImportJob | None) -> ErrorReport:
+        path = self._report_path(job.id) if job is not None else None
+        return ErrorReport(path, sample_size=settings.IMPORT_ERROR_SAMPLE_SIZE)
+
+    @staticmethod
+    def _finish_report(report: ErrorReport) -> str | None:
+        """Keep the report only when it has rows; returns its path for the job summary."""
+        if report.path is None:
+            return None
+        if not report.count:
+            report.path.unlink(missing_ok=True)
+            return None
+        return report.path.as_posix()
+
+    def _iter_chunks(
+        self,
+        file_path: Path,
+        sheet_name: str | None,
+        sheet_names: list[str] | None = None,
+    ) -> Iterator[RowChunk]:
+        rows = self._iter_rows(file_path, sheet_name, sheet_names)
+        try:
+            numbered = enumerate(rows, start=1)
+            while True:
+                chunk = list(islice(numbered, self.chunk_size))
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            rows.close()
+
+    def _iter_rows(
+        self,
+        file_path: Path,
+        sheet_name: str | None,
+        sheet_names: list[str] | None = None,
+    ) -> Iterator[ImportRow]:
+        suffix = self._ensure_supported(file_path.name)
+        if suffix == ".csv":
+            return self._iter_csv_rows(file_path)
+        if sheet_names:
+            return self._iter_sheets_parallel(file_path, sheet_names)
+        return self._iter_excel_rows(file_path, sheet_name)
+
+    @staticmethod
+    def _ensure_supported(filename: str) -> str:
+        suffix = Path(filename).suffix.lower()
+        if suffix not in {".csv", ".xlsx", ".xlsm"}:
+            raise ValueError(f"Unsupported file type '{suffix}'. Upload .csv or .xlsx files")
+        return suffix
+
+    @staticmethod
+    def _resolve_sheet_names(file_path: Path, requested: list[str] | None, all_sheets: bool) -> list[str] | None:
+        if not requested and not all_sheets:
+            return None
+        workbook = load_workbook(filename=file_path, read_only=True)
+        try:
+            available = list(workbook.sheetnames)
+        finally:
+            workbook.close()
+        if all_sheets:
+            return available
+
+        missing = [name for name in requested if name not in available]
+        if missing:
+            raise ValueError(f"Workbook has no sheet named {', '.join(repr(name) for name in missing)}")
+        return list(dict.fromkeys(requested))
+
+    @staticmethod
+    def _iter_sheets_parallel(file_path: Path, sheet_names: list[str]) -> Iterator[ImportRow]:
+        """Parse worksheets concurrently on a process pool, yielding their rows in sheet order.
+
+        The sheets are split into one contiguous group per worker so each process
+        reads the workbook once. Workers spool their rows to a temporary file in
+        ``IMPORT_CHUNK_SIZE`` batches, and the spools are read back one batch at a
+        time in group order, so neither side holds a whole sheet in memory and row
+        numbers and checkpoints stay deterministic.
+
+        The pool is billiard's (Celery's fork of multiprocessing): imports run in
+        Celery's prefork workers, which are daemonic, and only billiard lets a
+        daemonic process start children.
+        """
+        workers = min(len(sheet_names), settings.IMPORT_PARSE_WORKERS or os.cpu_count() or 1)
+        if workers <= 1:
+            yield from ImportService._iter_excel_sheets(file_path, sheet_names)
+            return
+
+        group_size = -(-len(sheet_names) // workers)
+        groups = [sheet_names[start:start + group_size] for start in range(0, len(sheet_names), group_size)]
+        make_row = ImportRow._make
+        with tempfile.TemporaryDirectory(prefix="import-sheets-") as spool_dir:
+            # spawn avoids forking a process that runs an event loop and DB connections.
+            pool = billiard.get_context("spawn").Pool(processes=len(groups))
+            try:
+                pending = deque()
+                for idx, group in enumerate(groups):
+                    spool_path = os.path.join(spool_dir, f"group-{idx}.pickle")
+                    pending.append((pool.apply_async(_parse_sheets, (str(file_path), group, spool_path)), spool_path))
+                while pending:
+                    result, spool_path = pending.popleft()
+                    result.get()
+                    with open(spool_path, "rb") as spool:
+                        while True:
+                            try:
+                                batch = pickle.load(spool)
+                            except EOFError:
+                                break
+                            for values in batch:
+                                yield make_row(values)
+                    os.remove(spool_path)
+            finally:
+                pool.terminate()
+
+    @staticmethod
+    def _iter_csv_rows(file_path: Path) -> Iterator[ImportRow]:
+        with file_path.open("r", encoding="utf-8-sig", newline="") as handle:
+            reader = csv.reader(handle)
+            header = next(reader, None)
+            if header is None:
+                return
+            extract = MappingProfile(header).compile()
+            for raw in reader:
+                if raw:
+                    yield extract(raw)
+
+    @staticmethod
+    def _iter_excel_rows(file_path: Path, sheet_name: str | None) -> Iterator[ImportRow]:
+        workbook = load_workbook(filename=file_path, data_only=True, read_only=True)
+        try:
+            worksheet = workbook[sheet_name] if sheet_name and sheet_name in workbook.sheetnames else workbook.active
+            yield from ImportService._iter_worksheet_rows(worksheet)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _iter_excel_sheets(file_path: Path, sheet_names: list[str]) -> Iterator[ImportRow]:
+        """Rows of several worksheets in order, reading the workbook only once."""
+        workbook = load_workbook(filename=file_path, data_only=True, read_only=True)
+        try:
+            for name in sheet_names:
+                yield from ImportService._iter_worksheet_rows(workbook[name])
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _iter_worksheet_rows(worksheet: Any) -> Iterator[ImportRow]:
+        iterator = worksheet.iter_rows(values_only=True)
+        header = next(iterator, None)
+        if header is None:
+            return
+
+        extract = MappingProfile(header).compile(skip_blank=True)
+        for raw in iterator:
+            row = extract(raw)
+            if row is not None:
+                yield row
+
+    async def _apply_inventory_updates(
+        self,
+        rows: list[tuple[int, ImportRow]],
+        state: _ImportState,
+        metrics: PipelineMetrics,
+    ) -> None:
+        branch_map = state.branch_map
+        model_code_map = state.model_code_map
+        model_name_map = state.model_name_map
+        errors = state.errors
+        staged: dict[InventoryKey, dict[str, int]] = {}
+        staged_digests: dict[RowKey, str] = {}
+        resolved: list[tuple[str, str, int, int]] = []
+        new_branches: list[Branch] = []
+        new_models: list[VehicleModel] = []
+        with metrics.stage("resolve", rows=len(rows)):
+            for idx, row in rows:
+                state.processed += 1
+                try:
+                    branch_code = self._require_field(row.branch_code, "branch_code")
+                    model_code = self._require_field(row.model_code, "model_code")
+                except ValueError as exc:
+                    errors.append({"row": idx, "detail": str(exc)})
+                    continue
+
+                row_key = (branch_code, model_code)
+                digest = self._row_digest(row)
+                if state.row_digests.get(row_key) == digest:
+                    state.skipped += 1
+                    continue
+
+                latitude = self._optional_float(row.latitude)
+                longitude = self._optional_float(row.longitude)
+
+                branch = branch_map.get(branch_code)
+                if branch is None:
+                    branch_name = self._optional_field(row.branch_name)
+                    branch_city = self._optional_field(row.city)
+                    if branch_name and branch_city:
+                        if latitude is not None and not (-90 <= latitude <= 90):
+                            errors.append({"row": idx, "detail": f"Latitude {latitude} out of range (-90 to 90)"})
+                            continue
+                        if longitude is not None and not (-180 <= longitude <= 180):
+                            errors.append({"row": idx, "detail": f"Longitude {longitude} out of range (-180 to 180)"})
+                            continue
+
+                        # Held back (not added to the session) until the chunk's single batched INSERT.
+                        branch = Branch(
+                            code=branch_code,
+                            name=branch_name,
+                            city=branch_city,
+                            latitude=latitude,
+                            longitude=longitude,
+                        )
+                        new_branches.append(branch)
+                        branch_map[branch_code] = branch
+                        if branch_code not in state.created_branch_codes:
+                            state.created_branch_codes.add(branch_code)
+                            state.branches_created += 1
+                    else:
+                        errors.append({
+                            "row": idx,
+                            "detail": (
+                                f"Unknown branch code '{branch_code}'. Provide branch_name and city (plus latitude/longitude for nearest calculation)."
+                            ),
+                        })
+                        continue
+
+                else:
                     if latitude is not None and not (-90 <= latitude <= 90):
                         errors.append({"row": idx, "detail": f"Latitude {latitude} out of range (-90 to 90)"})
                         continue
                     if longitude is not None and not (-180 <= longitude <= 180):
                         errors.append({"row": idx, "detail": f"Longitude {longitude} out of range (-180 to 180)"})
                         continue
-                    
-                    branch = Branch(
-                        code=branch_code,
-                        name=branch_name,
-                        city=branch_city,
-                        latitude=latitude,
-                        longitude=longitude,
-                    )
-                    self.session.add(branch)
-                    await self.session.flush()
-                    branch_map[branch_code] = branch
-                    if branch_code not in created_branch_codes:
-                        created_branch_codes.add(branch_code)
-                        branches_created += 1
-                else:
+
+                    has_coordinate_update = False
+                    if latitude is not None and branch.latitude != latitude:
+                        branch.latitude = latitude
+                        has_coordinate_update = True
+                    if longitude is not None and branch.longitude != longitude:
+                        branch.longitude = longitude
+                        has_coordinate_update = True
+                    branch_name = self._optional_field(row.branch_name)
+                    branch_city = self._optional_field(row.city)
+                    if branch_name and branch.name != branch_name:
+                        branch.name = branch_name
+                        has_coordinate_update = True
+                    if branch_city and branch.city != branch_city:
+                        branch.city = branch_city
+                        has_coordinate_update = True
+                    if has_coordinate_update and branch_code not in state.updated_branch_codes:
+                        state.updated_branch_codes.add(branch_code)
+                        state.branches_updated += 1
+
+                if (branch.latitude is None or branch.longitude is None) and branch_code not in state.missing_coordinates:
                     errors.append({
                         "row": idx,
                         "detail": (
-                            f"Unknown branch code '{branch_code}'. Provide branch_name and city (plus latitude/longitude for nearest calculation)."
+                            f"Branch '{branch_code}' is missing latitude/longitude. Nearest showroom calculations require coordinates."
                         ),
                     })
+                    state.missing_coordinates.add(branch_code)
+
+                # openpyxl already returns whole-number cells as ints; only text and floats need converting.
+                quantity = row.quantity
+                reserved = row.reserved or 0
+                try:
+                    if quantity.__class__ is not int:
+                        quantity = int(float(quantity))
+                    if reserved.__class__ is not int:
+                        reserved = int(float(reserved))
+                except (TypeError, ValueError, OverflowError):
+                    errors.append({"row": idx, "detail": "Quantity or reserved value is not a number"})
                     continue
 
-            else:
-                latitude = self._optional_float(raw_row, "latitude")
-                longitude = self._optional_float(raw_row, "longitude")
-                
-                # Validate coordinate ranges when updating
-                if latitude is not None and not (-90 <= latitude <= 90):
-                    errors.append({"row": idx, "detail": f"Latitude {latitude} out of range (-90 to 90)"})
+                if quantity < 0 or reserved < 0:
+                    errors.append({"row": idx, "detail": "Quantity and reserved must be non-negative"})
                     continue
-                if longitude is not None and not (-180 <= longitude <= 180):
-                    errors.append({"row": idx, "detail": f"Longitude {longitude} out of range (-180 to 180)"})
+
+                model = model_code_map.get(model_code)
+                if model is None:
+                    model_name = row.model_name or row.model or model_code
+                    normalized_model_name = str(model_name).strip().lower()
+                    model = model_name_map.get(normalized_model_name)
+
+                    if model is None:
+                        model = VehicleModel(name=str(model_name), external_code=model_code)
+                        new_models.append(model)
+                    elif model.external_code is None:
+                        # Attach the newly seen external code for existing models missing a code.
+                        model.external_code = model_code
+
+                    model_code_map[model_code] = model
+                    model_name_map[normalized_model_name] = model
+
+                resolved.append((branch_code, model_code, quantity, reserved))
+                state.row_digests[row_key] = digest
+                staged_digests[row_key] = digest
+
+            await self._insert_new_entities(new_branches, new_models, state)
+
+            for branch_code, model_code, quantity, reserved in resolved:
+                branch_id = branch_map[branch_code].id
+                model_id = model_code_map[model_code].id
+                key = (branch_id, model_id)
+                current = state.inventory.get(key)
+                if current is None:
+                    state.created += 1
+                elif current == (quantity, reserved):
+                    # Nothing to write, so the row's updated_at is left alone.
+                    state.unchanged += 1
                     continue
-                
-                has_coordinate_update = False
-                if latitude is not None and branch.latitude != latitude:
-                    branch.latitude = latitude
-                    has_coordinate_update = True
-                if longitude is not None and branch.longitude != longitude:
-                    branch.longitude = longitude
-                    has_coordinate_update = True
-                branch_name = self._optional_field(raw_row, "branch_name")
-                branch_city = self._optional_field(raw_row, "city")
-                if branch_name and branch.name != branch_name:
-                    branch.name = branch_name
-                    has_coordinate_update = True
-                if branch_city and branch.city != branch_city:
-                    branch.city = branch_city
-                    has_coordinate_update = True
-                if has_coordinate_update and branch_code not in updated_branch_codes:
-                    updated_branch_codes.add(branch_code)
-                    branches_updated += 1
-
-            if (branch.latitude is None or branch.longitude is None) and branch_code not in missing_coordinates:
-                errors.append({
-                    "row": idx,
-                    "detail": (
-                        f"Branch '{branch_code}' is missing latitude/longitude. Nearest showroom calculations require coordinates."
-                    ),
-                })
-                missing_coordinates.add(branch_code)
-
-            quantity_raw = raw_row.get("quantity")
-            reserved_raw = raw_row.get("reserved", 0)
+                else:
+                    state.updated += 1
+                state.inventory[key] = (quantity, reserved)
+                # Later rows for the same branch/model win, exactly as sequential updates did.
+                staged[key] = {"branch_id": branch_id, "model_id": model_id, "quantity": quantity, "reserved": reserved}
 
-            try:
-                quantity = int(float(quantity_raw))
-                reserved = int(float(reserved_raw or 0))
-            except (TypeError, ValueError):
-                errors.append({"row": idx, "detail": "Quantity or reserved value is not a number"})
-                continue
+        with metrics.stage("write", rows=len(rows)):
+            await self._upsert(
+                Inventory,
+                list(staged.values()),
+                index_elements=[Inventory.branch_id, Inventory.model_id],
+                update_columns=("quantity", "reserved"),
+            )
+            await self._upsert(
+                ImportRowDigest,
+                [
+                    {"branch_code": branch_code, "model_code": model_code, "digest": digest, "cleared_at": None}
+                    for (branch_code, model_code), digest in staged_digests.items()
+                ],
+                index_elements=[ImportRowDigest.branch_code, ImportRowDigest.model_code],
+                update_columns=("digest", "cleared_at"),
+            )
 
-            if quantity < 0 or reserved < 0:
-                errors.append({"row": idx, "detail": "Quantity and reserved must be non-negative"})
-                continue
+    async def _insert_new_entities(
+        self,
+        new_branches: list[Branch],
+        new_models: list[VehicleModel],
+        state: _ImportState,
+    ) -> None:
+        """Insert the chunk's unseen branches and models with one ``INSERT ... RETURNING`` each.
 
-            model = model_code_map.get(model_code)
-            if model is None:
-                model_name = raw_row.get("model_name") or raw_row.get("model") or model_code
-                normalized_model_name = str(model_name).strip().lower()
-                model = model_name_map.get(normalized_model_name)
+        The placeholders collected while resolving rows are swapped for the returned
+        persistent instances in every lookup map, so their ids are available to the
+        inventory rows of the same chunk.
+        """
+        if new_branches:
+            stmt = insert(Branch).returning(Branch, sort_by_parameter_order=True)
+            created = await self.session.scalars(
+                stmt,
+                [
+                    {
+                        "code": branch.code,
+                        "name": branch.name,
+                        "city": branch.city,
+                        "latitude": branch.latitude,
+                        "longitude": branch.longitude,
+                    }
+                    for branch in new_branches
+                ],
+            )
+            for branch in created.all():
+                state.branch_map[branch.code] = branch
 
-                if model is None:
-                    model = VehicleModel(name=str(model_name), external_code=model_code)
-                    self.session.add(model)
-                    await self.session.flush()
-                elif model.external_code is None:
-                    # Attach the newly seen external code for existing models missing a code.
-                    model.external_code = model_code
-
-                model_code_map[model_code] = model
-                model_name_map[normalized_model_name] = model
-
-            inventory = await self._fetch_inventory(branch.id, model.id)
-            if inventory is None:
-                inventory = Inventory(branch_id=branch.id, model_id=model.id, quantity=quantity, reserved=reserved)
-                self.session.add(inventory)
-                created += 1
-            else:
-                inventory.quantity = quantity
-                inventory.reserved = reserved
-                updated += 1
+        if new_models:
+            stmt = insert(VehicleModel).returning(VehicleModel, sort_by_parameter_order=True)
+            created = await self.session.scalars(
+                stmt,
+                [{"name": model.name, "external_code": model.external_code} for model in new_models],
+            )
+            replacements = {id(placeholder): model for placeholder, model in zip(new_models, created.all())}
+            for lookup in (state.model_code_map, state.model_name_map):
+                for key, model in lookup.items():
+                    if id(model) in replacements:
+                        lookup[key] = replacements[id(model)]
 
-        await self.session.commit()
+    async def _upsert(
+        self,
+        model: type[Base],
+        values: list[dict[str, Any]],
+        index_elements: list[Any],
+        update_columns: tuple[str, ...],
+    ) -> None:
+        """Write staged rows with batched ``INSERT ... ON CONFLICT DO UPDATE``."""
+        if not values:
+            return
 
-        return {
-            "processed_rows": processed,
-            "created": created,
-            "updated": updated,
-            "branches_created": branches_created,
-            "branches_updated": branches_updated,
-            "errors": errors,
-        }
+        dialect = self.session.get_bind().dialect.name
+        insert_factory = sqlite_insert if dialect == "sqlite" else pg_insert
+        for start in range(0, len(values), UPSERT_BATCH_SIZE):
+            stmt = insert_factory(model).values(values[start:start + UPSERT_BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={
+                    **{column: stmt.excluded[column] for column in update_columns},
+                    "updated_at": func.now(),
+                },
+            )
+            await self.session.execute(stmt)
 
     async def _load_branch_map(self) -> dict[str, Branch]:
         result = await self.session.execute(select(Branch))
@@ -299,40 +1083,55 @@ class ImportService:
             name_map[model.name.strip().lower()] = model
         return code_map, name_map
 
-    async def _fetch_inventory(self, branch_id: int, model_id: int) -> Inventory | None:
-        stmt = select(Inventory).where(Inventory.branch_id == branch_id, Inventory.model_id == model_id)
-        result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+    async def _load_row_digests(self) -> dict[RowKey, str]:
+        result = await self.session.execute(
+            select(ImportRowDigest.branch_code, ImportRowDigest.model_code, ImportRowDigest.digest).where(
+                ImportRowDigest.cleared_at.is_(None)
+            )
+        )
+        return {(branch_code, model_code): digest for branch_code, model_code, digest in result.all()}
+
+    async def _load_inventory_snapshot(self) -> dict[InventoryKey, tuple[int, int]]:
+        result = await self.session.execute(
+            select(Inventory.branch_id, Inventory.model_id, Inventory.quantity, Inventory.reserved)
+        )
+        return {
+            (branch_id, model_id): (quantity, reserved)
+            for branch_id, model_id, quantity, reserved in result.all()
+        }
 
     @staticmethod
-    def _normalize_header(value: Any) -> str:
-        if value is None:
-            return ""
-        if isinstance(value, str):
-            normalized = value.strip().lower().replace(" ", "_").replace("-", "_")
-            return normalized
-        return str(value).strip().lower()
+    def _row_digest(row: ImportRow) -> str:
+        payload = "\x1f".join(map(str, row))
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
 
     @staticmethod
-    def _require_field(row: dict[str, Any], key: str) -> str:
-        value = row.get(key)
+    def _require_field(value: Any, key: str) -> str:
         if value in (None, ""):
             raise ValueError(f"Missing required column '{key}'")
         return str(value).strip()
 
     @staticmethod
-    def _optional_field(row: dict[str, Any], key: str) -> str | None:
-        value = row.get(key)
+    def _optional_field(value: Any) -> str | None:
         if value in (None, ""):
             return None
         return str(value).strip()
 
     @staticmethod
-    def _optional_float(row: dict[str, Any], key: str) -> float | None:
-        value = row.get(key)
-        if value in (None, ""):
-            return None
+    def _optional_float(value: Any) -> float | None:
+        # openpyxl already returns numeric cells as floats; None and "" fall through to the except.
+        if value.__class__ is float:
+            return value
         try:
             return float(value)
         except (TypeError, ValueError):
             return None
+
+
+def _parse_sheets(file_path: str, sheet_names: list[str], spool_path: str) -> None:
+    """Process-pool entry point; spools the rows as pickled batches of plain tuples, which are smaller than ``ImportRow``s."""
+    rows = ImportService._iter_excel_sheets(Path(file_path), sheet_names)
+    batch_size = max(settings.IMPORT_CHUNK_SIZE, 1)
+    with open(spool_path, "wb") as spool:
+        while batch := [tuple(row) for row in islice(rows, batch_size)]:
+            pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import csv
+import enum
+import io
+import json
+import logging
+import time
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Literal, Sequence
+
+from sqlalchemy import Select
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+ExportFormat = Literal["csv", "ndjson"]
+
+MEDIA_TYPES: dict[str, str] = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class RowEncoder:
+    """Turns batches of result rows into CSV or NDJSON bytes, optionally gzip-compressed."""
+
+    def __init__(self, columns: Sequence[str], fmt: ExportFormat, compress: bool = False) -> None:
+        self.columns = list(columns)
+        self.fmt = fmt
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer) if fmt == "csv" else None
+        self._compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def start(self) -> bytes:
+        if self._writer is None:
+            return b""
+        self._writer.writerow(self.columns)
+        return self._emit()
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        if self._writer is not None:
+            self._writer.writerows([[_csv_value(value) for value in row] for row in rows])
+        else:
+            columns = self.columns
+            self._buffer.writelines(
+                json.dumps(dict(zip(columns, row)), default=_json_value, separators=(",", ":")) + "\n"
+                for row in rows
+            )
+        return self._emit()
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() if self._compressor is not None else b""
+
+    def _emit(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if self._compressor is not None:
+            return self._compressor.compress(data)
+        return data
+
+
+def export_filename(name: str, fmt: ExportFormat, compress: bool) -> str:
+    return f"{name}.{fmt}.gz" if compress else f"{name}.{fmt}"
+
+
+async def stream_query(
+    stmt: Select,
+    fmt: ExportFormat,
+    compress: bool = False,
+    label: str = "export",
+) -> AsyncIterator[bytes]:
+    """Stream ``stmt`` from a server-side cursor as encoded chunks of ``IMPORT_CHUNK_SIZE`` rows.
+
+    The query runs on its own session because the response body is produced after
+    the request's dependencies have been torn down. Throughput is logged once the
+    last chunk has been sent.
+    """
+    encoder = RowEncoder([column.name for column in stmt.selected_columns], fmt, compress)
+    started = time.perf_counter()
+    rows = 0
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt.execution_options(yield_per=max(settings.IMPORT_CHUNK_SIZE, 1)))
+        yield encoder.start()
+        async for partition in result.partitions():
+            rows += len(partition)
+            yield encoder.encode(partition)
+        yield encoder.finish()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Streamed %d %s rows as %s in %.2fs (%.0f rows/s)",
+        rows,
+        label,
+        fmt,
+        elapsed,
+        rows / elapsed if elapsed > 0 else 0.0,
+    )
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
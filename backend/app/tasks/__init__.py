@@ -8,6 +8,12 @@ celery_app = Celery(
     "honda_internal",
     broker=settings.celery_broker(),
     backend=settings.celery_backend(),
+    include=["app.tasks.imports"],
 )
 
-celery_app.conf.update(task_serializer="json", accept_content=["json"], result_serializer="json")
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    result_serializer="json",
+    task_always_eager=settings.CELERY_TASK_ALWAYS_EAGER,
+)
@@ -1,9 +1,27 @@
 from __future__ import annotations
 
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.services.imports import ImportService
 from app.tasks import celery_app
 
 
-@celery_app.task
+# acks_late makes the broker redeliver a job whose worker died mid-import; it then resumes from its checkpoint.
+@celery_app.task(acks_late=True)
 def process_import_job(job_id: int) -> None:
-    # TODO: Implement import processing pipeline
-    return None
+    asyncio.run(_process_import_job(job_id))
+
+
+async def _process_import_job(job_id: int) -> None:
+    # Each task runs on its own event loop, so it cannot share the API's pooled connections.
+    engine = create_async_engine(settings.database_uri(), poolclass=NullPool)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+    try:
+        async with session_factory() as session:
+            await ImportService(session).process_job(job_id)
+    finally:
+        await engine.dispose()
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db.session import AsyncSessionLocal
+from app.services.imports import ImportService
+
+
+async def prune_import_storage(retention_days: int | None, dry_run: bool) -> None:
+    async with AsyncSessionLocal() as session:
+        removed = await ImportService(session).prune_storage(retention_days=retention_days, dry_run=dry_run)
+
+    action = "Would remove" if dry_run else "Removed"
+    for path in removed:
+        print(f"{action} {path.as_posix()}")
+    print(f"{action} {len(removed)} file(s) from storage/imports")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune import blobs no longer referenced by any import job.")
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=None,
+        help="Also prune blobs only referenced by finished jobs older than this many days.",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="List files without deleting them.")
+    args = parser.parse_args()
+    asyncio.run(prune_import_storage(args.retention_days, args.dry_run))